@@ -0,0 +1,255 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from src.kernel.results import Results
+import importlib.util
+import logging
+import zipfile
+import h5py
+
+# formats of the time series (Results) and of the tables (e.g. economic performance)
+SERIES_FORMATS = ['csv', 'hdf5', 'npz', 'parquet']
+TABLE_FORMATS = ['excel', 'hdf5', 'npz', 'parquet']
+EXTENSIONS = {'csv': '.csv', 'excel': '.xlsx', 'hdf5': '.h5', 'npz': '.npz', 'parquet': '.parquet'}
+# optional packages used by pandas for each format, at least one of them must be installed
+ENGINES = {'excel': ['openpyxl', 'xlsxwriter'], 'parquet': ['pyarrow', 'fastparquet']}
+
+logger = logging.getLogger(__name__)
+
+
+class ResultWriter:
+    def __init__(self, output_dir, formats=('csv', 'excel'), background=True, compression='gzip',
+                 compression_level=4, chunk_steps=8760):
+        """
+        writes the outputs of a run in one or more formats. With background=True the writes are queued to a single
+        writer thread, so that they overlap with the rest of the run: the data passed to the writer must not be
+        modified afterwards, close() waits for the queued writes and raises their errors. Used as a context manager
+        the writer is closed on exit, also when the run fails.
+
+        :param output_dir: str or Path --> output directory
+        :param formats: list of str --> 'csv' (time series only), 'excel' (tables only), 'hdf5' (chunked and
+            compressed, h5py), 'npz', 'parquet' (requires pyarrow or fastparquet)
+        :param background: bool --> writes on a background thread
+        :param compression: str --> HDF5 compression filter e.g. 'gzip', 'lzf', None
+        :param compression_level: int --> level of the gzip filter (0-9)
+        :param chunk_steps: int --> time steps per HDF5 chunk
+        """
+        unknown = set(formats) - set(EXTENSIONS)
+        if unknown:
+            raise ValueError(f"Unrecognized output formats: {sorted(unknown)}")
+        for fmt in formats:
+            if fmt in ENGINES and not any(importlib.util.find_spec(engine) for engine in ENGINES[fmt]):
+                raise ImportError(f"Output format '{fmt}' requires one of {ENGINES[fmt]}")
+        if 'hdf5' in formats and compression not in ('gzip', 'lzf', None):
+            raise ValueError(f"Unrecognized HDF5 compression: {compression}")
+        self.output_dir = Path(output_dir)
+        self.formats = list(formats)
+        self.compression = compression
+        self.compression_level = compression_level if compression == 'gzip' else None
+        self.chunk_steps = chunk_steps
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.futures = []
+        self.written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # the run failed: the queued writes are completed, their errors are logged and the run error is raised
+        try:
+            self.close()
+        except Exception:
+            logger.exception("Output writes failed after an error of the run")
+
+    def submit(self, function, *args):
+        if self.executor is None:
+            function(*args)
+        else:
+            self.futures.append(self.executor.submit(function, *args))
+
+    def write_series(self, name, results, entities=None):
+        """
+        queues the writing of time series in every series format
+
+        :param name: str --> file name without extension e.g. 'recs_en_perf_evolution_kW'
+        :param results: obj by Results
+        :param entities: list of str --> entities to write, None for all
+        """
+        for fmt in self.formats:
+            if fmt in SERIES_FORMATS:
+                self.submit(getattr(self, f"series_{fmt}"), self.output_dir / f"{name}{EXTENSIONS[fmt]}", results,
+                            entities)
+
+    def write_table(self, name, df):
+        """
+        queues the writing of a table in every table format
+
+        :param name: str --> file name without extension e.g. 'recs_ec_perf_€'
+        :param df: DataFrame
+        """
+        for fmt in self.formats:
+            if fmt in TABLE_FORMATS:
+                self.submit(getattr(self, f"table_{fmt}"), self.output_dir / f"{name}{EXTENSIONS[fmt]}", df)
+
+    def close(self):
+        """
+        waits for the queued writes
+        :return: list of Path --> written files
+        """
+        if self.executor is not None:
+            try:
+                for future in self.futures:
+                    future.result()
+            finally:
+                self.executor.shutdown(wait=True)
+                self.futures = []
+        return self.written
+
+    @staticmethod
+    def selection(results, entities):
+        """
+        :return: block (series x time step) and index of the selected entities
+        """
+        rows = results.select(entity=entities)
+        return results.values(entity=entities), [results.index[row] for row in rows]
+
+    def series_csv(self, path, results, entities):
+        results.frame(entity=entities, names='flat').to_csv(path)
+        self.written.append(path)
+
+    def series_hdf5(self, path, results, entities):
+        block, index = self.selection(results, entities)
+        with h5py.File(path, 'w') as file:
+            chunks = (max(1, min(len(index), 64)), max(1, min(block.shape[1], self.chunk_steps))) if block.size else None
+            file.create_dataset('block', data=block, chunks=chunks, compression=self.compression if chunks else None,
+                                compression_opts=self.compression_level if chunks else None,
+                                shuffle=bool(self.compression and chunks))
+            file.create_dataset('index', data=np.array(index, dtype=h5py.string_dtype()).reshape(-1, 3))
+            if results.timeline is not None:
+                file.create_dataset('time', data=self.time_ns(results.timeline))
+        self.written.append(path)
+
+    def series_npz(self, path, results, entities):
+        # uncompressed, so that the block can be memory mapped by read_results
+        block, index = self.selection(results, entities)
+        arrays = {'block': np.ascontiguousarray(block), 'index': np.array(index, dtype=str).reshape(-1, 3)}
+        if results.timeline is not None:
+            arrays['time'] = self.time_ns(results.timeline)
+        np.savez(path, **arrays)
+        self.written.append(path)
+
+    def series_parquet(self, path, results, entities):
+        results.frame(entity=entities, names='flat').to_parquet(path)
+        self.written.append(path)
+
+    def table_excel(self, path, df):
+        df.to_excel(path, index=False)
+        self.written.append(path)
+
+    def table_hdf5(self, path, df):
+        with h5py.File(path, 'w') as file:
+            for column in df.columns:
+                file.create_dataset(str(column), data=np.asarray(df[column], dtype=float))
+            file.attrs['columns'] = [str(column) for column in df.columns]
+        self.written.append(path)
+
+    def table_npz(self, path, df):
+        np.savez(path, **{str(column): np.asarray(df[column], dtype=float) for column in df.columns})
+        self.written.append(path)
+
+    def table_parquet(self, path, df):
+        df.to_parquet(path, index=False)
+        self.written.append(path)
+
+    @staticmethod
+    def time_ns(timeline):
+        index = pd.DatetimeIndex(timeline)
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        return index.as_unit('ns').asi8
+
+
+def read_results(path):
+    """
+    reads time series written by ResultWriter. HDF5 files are read lazily (each series is read from disk when
+    accessed, the file stays open in results.file), the block of .npz files is memory mapped, csv and parquet files
+    are parsed (the index is recovered from the column names 'entity_carrier_quantity', so entities with '_' in their
+    id are only recovered from .h5 and .npz files).
+
+    :param path: str or Path --> .h5, .npz, .csv or .parquet file
+    :return: obj by Results
+    """
+    path = Path(path)
+    if path.suffix == '.h5':
+        file = h5py.File(path, 'r')
+        index = [tuple(key) for key in file['index'].asstr()[()]]
+        timeline = pd.to_datetime(file['time'][()]) if 'time' in file else None
+        results = Results(block=file['block'], index=index, timeline=timeline)
+        results.file = file
+        return results
+    if path.suffix == '.npz':
+        with np.load(path) as data:
+            index = [tuple(key) for key in data['index']]
+            timeline = pd.to_datetime(data['time']) if 'time' in data else None
+        return Results(block=map_npz_member(path, 'block'), index=index, timeline=timeline)
+    if path.suffix in ('.csv', '.parquet'):
+        df = pd.read_csv(path, index_col=0, parse_dates=True) if path.suffix == '.csv' else pd.read_parquet(path)
+        return Results(block=df.to_numpy().T, index=[column.split('_', 2) for column in df.columns],
+                       timeline=df.index if isinstance(df.index, pd.DatetimeIndex) else None)
+    raise ValueError(f"Unrecognized results file: {path}")
+
+
+def map_npz_member(path, name):
+    """
+    memory maps an array stored uncompressed in a .npz file
+    :param path: Path --> .npz file
+    :param name: str --> array name
+    :return: array (read only)
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(f"{name}.npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member)
+    with open(path, 'rb') as file:
+        # local file header: 30 bytes, then file name and extra field
+        file.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype='<u2')
+        file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+def read_table(path):
+    """
+    reads a table written by ResultWriter
+    :param path: str or Path --> .xlsx, .h5, .npz or .parquet file
+    :return: DataFrame
+    """
+    path = Path(path)
+    if path.suffix == '.xlsx':
+        return pd.read_excel(path)
+    if path.suffix == '.h5':
+        with h5py.File(path, 'r') as file:
+            return pd.DataFrame({column: file[column][()] for column in file.attrs['columns']})
+    if path.suffix == '.npz':
+        with np.load(path) as data:
+            return pd.DataFrame({column: data[column] for column in data.files})
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    raise ValueError(f"Unrecognized table file: {path}")
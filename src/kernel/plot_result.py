@@ -12,7 +12,6 @@ from datetime import datetime
 
 
 def filter_by_period(df, period,year):
-    df = df.copy()
     if period == 'Winter':
         mask = ((df.index >= f"{year}-12-21") & (df.index <= f"{year}-12-22"))
     elif period == 'Spring':
@@ -26,31 +25,15 @@ def filter_by_period(df, period,year):
     return df
 
 
-def to_df(en_perf_evolution, timeline):
-    clean_dict = {}
-    for k, v in en_perf_evolution.items():
-        if isinstance(v, pd.Series):
-            clean_dict[k] = v.values
-        elif isinstance(v, (list, np.ndarray)):
-            clean_dict[k] = np.array(v)
-        else:
-            raise TypeError(f"Unsupported type for {k}: {type(v)}")
-    df = pd.DataFrame(clean_dict, index=timeline)
-    return df
-
-
-
 def plot(simulation,all_components):
-    timeline=simulation['timeline']
+    results=simulation['results']
     dt = datetime.strptime(simulation['start_date'], '%d-%m-%Y')
     time_step=simulation['time_step']
     year = dt.year
     period_list=['Winter', 'Spring', 'Summer', 'Autumn']
-    list_prosumer=list(all_components['prosumers'].values())
-    list_rec = list(all_components['recs'].values())
-    for prosumer in list_prosumer:
+    for pros_id, prosumer in all_components['prosumers'].items():
         for carrier in prosumer.carriers:
-            df0=to_df(prosumer.en_perf_evolution[carrier], timeline)
+            df0=results.frame(entity=pros_id, carrier=carrier)
             for start, period in enumerate(period_list):
                 df=filter_by_period(df0,period,year)
                 plt.figure()
@@ -103,9 +86,9 @@ def plot(simulation,all_components):
                 plt.show()
                 plt.close()
 
-    for rec in list_rec:
+    for rec_id, rec in all_components['recs'].items():
         for carrier in rec.carriers:
-            df1=to_df(rec.en_perf_evolution[carrier], timeline)
+            df1=results.frame(entity=rec_id, carrier=carrier)
             for start, period in enumerate(period_list):
                 df2=filter_by_period(df1,period,year)
                 plt.figure()
@@ -0,0 +1,153 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Results:
+    def __init__(self, block, index, timeline=None, groups=None):
+        """
+        time series of a run stored in a single contiguous block (one row per series), with an (entity, carrier,
+        quantity) index. Series are returned as views on the block and DataFrames are built on first use and cached.
+
+        :param block: 2D array --> (series x time step) values, e.g. kW. Other array-likes supporting row slicing (e.g.
+            an h5py Dataset, see output.read_results) are kept as they are and read row by row on access
+        :param index: list of tuple --> (entity, carrier, quantity) of each row of the block e.g. [('rec1','electricity','prod')]
+        :param timeline: DatetimeIndex --> time stamps of the columns of the block, None for a range index
+        :param groups: dict --> {group: list of entities} e.g. {'prosumers': ['prosumer1'], 'recs': ['rec1']}
+        """
+        self.block = np.ascontiguousarray(block) if isinstance(block, (np.ndarray, list)) else block
+        self.index = [tuple(key) for key in index]
+        self.rows = {key: row for row, key in enumerate(self.index)}
+        if len(self.rows) != len(self.index):
+            raise ValueError("duplicated (entity, carrier, quantity) in the results index")
+        self.timeline = timeline
+        self.groups = groups or {}
+        self.frames = {}
+
+    @classmethod
+    def from_components(cls, components, timeline=None, bind=True):
+        """
+        collects the series of the en_perf_evolution of each entity into the block, with rows ordered by entity,
+        carrier and quantity (the rows of an entity, or of an entity and a carrier, are contiguous). The block takes
+        the dtype of the series (float32 if they are all float32).
+
+        :param components: dict --> {group: {entity: obj with en_perf_evolution {carrier: {quantity: series}}}}
+            e.g. {'prosumers': prosumers, 'recs': recs}
+        :param timeline: DatetimeIndex --> time stamps of the series
+        :param bind: bool --> replaces the series in en_perf_evolution with their views on the block, so that the
+            components and the results share the same memory
+        :return: obj by Results
+        """
+        index = []
+        series = []
+        groups = {}
+        for group, entities in components.items():
+            groups[group] = []
+            for entity, obj in entities.items():
+                groups[group].append(entity)
+                for carrier, flows in obj.en_perf_evolution.items():
+                    for quantity, values in flows.items():
+                        index.append((entity, carrier, quantity))
+                        series.append(np.asarray(values))
+
+        dtype = np.result_type(np.float32, *(values.dtype for values in series))
+        block = np.empty((len(series), len(series[0]) if series else 0), dtype=dtype)
+        for row, values in enumerate(series):
+            block[row] = values
+        results = cls(block=block, index=index, timeline=timeline, groups=groups)
+
+        if bind:
+            for group, entities in components.items():
+                for entity, obj in entities.items():
+                    for carrier, flows in obj.en_perf_evolution.items():
+                        for quantity in flows:
+                            flows[quantity] = results.series(entity, carrier, quantity)
+        return results
+
+    def series(self, entity, carrier, quantity):
+        """
+        :return: array --> view on the row of the block
+        """
+        return self.block[self.rows[(entity, carrier, quantity)]]
+
+    def __getitem__(self, key):
+        return self.series(*key)
+
+    def __contains__(self, key):
+        return tuple(key) in self.rows
+
+    def select(self, entity=None, carrier=None, quantity=None):
+        """
+        :param entity: str or list of str --> entities to select, None for all
+        :param carrier: str or list of str --> carriers to select, None for all
+        :param quantity: str or list of str --> quantities to select, None for all
+        :return: list of int --> rows of the selected series, in block order
+        """
+        def match(value, wanted):
+            return wanted is None or value == wanted or (isinstance(wanted, (list, tuple)) and value in wanted)
+        return [row for row, (e, c, q) in enumerate(self.index)
+                if match(e, entity) and match(c, carrier) and match(q, quantity)]
+
+    def values(self, entity=None, carrier=None, quantity=None):
+        """
+        :return: 2D array --> (series x time step) values of the selection, see select. A view on the block when the
+            selected rows are contiguous (e.g. all the series of an entity or of an entity and carrier), a copy otherwise
+        """
+        rows = self.select(entity, carrier, quantity)
+        if rows and rows[-1] - rows[0] + 1 == len(rows):
+            return self.block[rows[0]:rows[-1] + 1]
+        return self.block[rows]
+
+    def frame(self, entity=None, carrier=None, quantity=None, names='quantity'):
+        """
+        DataFrame of a selection (see select), indexed by the timeline, built on first use and cached. Contiguous
+        selections are wrapped without copying the block: the DataFrame shares its memory with the block and with the
+        components, copy it before modifying it.
+
+        :param names: str --> column names: 'quantity' (e.g. 'prod', for the series of a single entity and carrier) or
+            'flat' (e.g. 'rec1_electricity_prod', as in the csv outputs)
+        :return: DataFrame
+        """
+        key = (self.hashable(entity), self.hashable(carrier), self.hashable(quantity), names)
+        if key not in self.frames:
+            rows = self.select(entity, carrier, quantity)
+            if names == 'quantity':
+                columns = [self.index[row][2] for row in rows]
+            elif names == 'flat':
+                columns = ['_'.join(self.index[row]) for row in rows]
+            else:
+                raise ValueError(f"Unrecognized column names: {names}")
+            frame = pd.DataFrame(self.values(entity, carrier, quantity).T, index=self.timeline, columns=columns,
+                                 copy=False)
+            if self.timeline is not None:
+                frame.index.name = 'date'
+            self.frames[key] = frame
+        return self.frames[key]
+
+    @staticmethod
+    def hashable(selection):
+        return tuple(selection) if isinstance(selection, list) else selection
+
+    def entities(self, group=None):
+        """
+        :param group: str --> e.g. 'prosumers', None for all the entities
+        :return: list of str
+        """
+        if group is not None:
+            return list(self.groups[group])
+        return list(dict.fromkeys(entity for entity, carrier, quantity in self.index))
+
+    def carriers(self, entity):
+        """
+        :return: list of str --> carriers of the entity
+        """
+        return list(dict.fromkeys(c for e, c, q in self.index if e == entity))
+
+    def quantities(self, entity, carrier):
+        """
+        :return: list of str --> quantities of the entity for the carrier
+        """
+        return [q for e, c, q in self.index if e == entity and c == carrier]
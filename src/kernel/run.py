@@ -4,17 +4,28 @@ Created on June 7 08:00:00 2025
 @author: isabella pizzuti
 """
 from src.rec_sim.Consumer import Consumer
+from src.rec_sim.DemandMatrix import DemandMatrix
 from src.rec_sim.Prosumer import Prosumer
 from src.rec_sim.Rec import Rec
 from src.rec_sim.Bess import Bess
+from src.rec_sim.BessFleet import BessFleet
 from src.rec_sim.PvPanels import PvPanels
+from src.kernel.weather import WeatherStore, WeatherFetcher, PVGIS_URL
+from src.kernel.results import Results
+from src.kernel.output import ResultWriter
 import yaml
 import pvlib
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import hashlib
+import logging
+import time
 import re
 
+logger = logging.getLogger(__name__)
+
+
 def time_step_to_hour_fraction(time_step):
     match = re.match(r'(\d+)\s*min', time_step.lower())
     if match:
@@ -26,7 +37,205 @@ def time_step_to_hour_fraction(time_step):
         return float(hours)
     raise ValueError("Unrecognized time_step format")
 
-def run(file_path,output_dir,base_path=None):
+# solar position per site {(lat, lon, first time stamp, last time stamp, n. of time stamps): (apparent zenith, azimuth)}
+solar_position_cache = {}
+
+def compute_aoi(times, lat, lon, tilt, azimuth):
+    """
+    angle of incidence of beam radiation on the array surface. The solar position is computed on the whole time index
+    at once and cached per site, so that arrays sharing a site only recompute the cheap projection on their surface.
+
+    :param times: DatetimeIndex --> time stamps of the weather data
+    :param lat: float --> (°) latitude
+    :param lon: float --> (°) longitude
+    :param tilt: float --> (°) slope of the array
+    :param azimuth: float --> (°) azimuth of the array, same convention of pvlib.iotools.pvgis.get_pvgis_hourly (north=0, south=180)
+    :return: array --> (°) angle of incidence
+    """
+    key = (lat, lon, times[0], times[-1], len(times))
+    if key not in solar_position_cache:
+        solpos = pvlib.solarposition.get_solarposition(times, lat, lon)
+        solar_position_cache[key] = (solpos['apparent_zenith'].to_numpy(), solpos['azimuth'].to_numpy())
+    zenith, sun_azimuth = solar_position_cache[key]
+    return np.asarray(pvlib.irradiance.aoi(surface_tilt=tilt, surface_azimuth=azimuth, solar_zenith=zenith,
+                                           solar_azimuth=sun_azimuth))
+
+def compute_pv_outputs(systems, irradiation_data, orientation, solver='batch', aoi=None, upsample=1, upsampling='hold',
+                       dtype=float):
+    """
+    computes the output of all PV systems. Systems sharing module datasheet, tilt, azimuth and weather data, which
+    differ only in n_series/n_parallel, are solved once for a single module and the output of each array is obtained
+    by scaling (see PvPanels.scale_output).
+
+    :param systems: dict --> {sys_id: obj by PvPanels}
+    :param irradiation_data: dict --> {sys_id: (I_beam, I_skydiff, I_grounddiff, t_amb)}
+    :param orientation: dict --> {sys_id: (tilt, azimuth)}
+    :param solver: str --> PV solver, see PvPanels.compute_output
+    :param aoi: dict --> {sys_id: angle of incidence (°)} to apply incidence angle modifiers, None to neglect them
+    :param upsample: int --> simulation time steps per step of the weather data, see PvPanels.compute_output
+    :param upsampling: str --> 'hold' or 'interpolate', see System.upsample
+    :param dtype: numpy dtype --> dtype of the production curves, see PvPanels.compute_output
+    :return: shared_solves: dict --> {sys_id: id of the first system of its group} for each system served by a shared solve
+    """
+    groups = {}
+    for sys_id, obj in systems.items():
+        tilt, azimuth = orientation[sys_id]
+        digest = hashlib.sha1()
+        for series in irradiation_data[sys_id]:
+            digest.update(np.ascontiguousarray(series, dtype=float).tobytes())
+        if aoi is not None:
+            digest.update(np.ascontiguousarray(aoi[sys_id], dtype=float).tobytes())
+        key = (tuple(obj.datasheet.items()), tilt, azimuth, digest.hexdigest())
+        groups.setdefault(key, []).append(sys_id)
+
+    shared_solves = {}
+    for sys_ids in groups.values():
+        leader = systems[sys_ids[0]]
+        tilt = orientation[sys_ids[0]][0]
+        I_beam, I_skydiff, I_grounddiff, t_amb = irradiation_data[sys_ids[0]]
+        theta = aoi[sys_ids[0]] if aoi is not None else None
+        if len(sys_ids) == 1:
+            leader.compute_output(slope=tilt, theta=theta, I_beam=I_beam, I_skydiff=I_skydiff,
+                                  I_grounddiff=I_grounddiff, t_amb=t_amb, solver=solver, upsample=upsample,
+                                  upsampling=upsampling, dtype=dtype)
+            continue
+
+        module_output = leader.unit_module().compute_output(slope=tilt, theta=theta, I_beam=I_beam, I_skydiff=I_skydiff,
+                                                            I_grounddiff=I_grounddiff, t_amb=t_amb, solver=solver)
+        for sys_id in sys_ids:
+            systems[sys_id].scale_output(*module_output, upsample=upsample, upsampling=upsampling, dtype=dtype)
+            shared_solves[sys_id] = sys_ids[0]
+
+    return shared_solves
+
+def simulate_pv(systems, weather_fetcher, weather_requests, location, orientation, simulation_conf, time_step,
+                drop_leap_day=False, dtype=float):
+    """
+    computes the output of all PV systems, the output of each group of systems is computed as soon as its weather
+    data arrive (see WeatherFetcher.fetch_all and compute_pv_outputs)
+
+    :param systems: dict --> {sys_id: obj by PvPanels}
+    :param weather_fetcher: obj by WeatherFetcher
+    :param weather_requests: dict --> {sys_id: request}, see WeatherFetcher.fetch_all
+    :param location: dict --> {sys_id: (lat, lon)}
+    :param orientation: dict --> {sys_id: (tilt, azimuth)}
+    :param simulation_conf: dict --> simulation section of the config
+    :param time_step: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+    :param drop_leap_day: bool --> removes 29 February from the weather data, so that every year has 8760 hours
+    :param dtype: numpy dtype --> dtype of the production curves, see PvPanels.compute_output
+    :return: shared_solves: dict --> see compute_pv_outputs
+    """
+    use_iam = simulation_conf.get("iam", False)
+    shared_solves = {}
+    for sys_ids, irr in weather_fetcher.fetch_all(weather_requests):
+        times = irr['time']
+        keep = slice(None)
+        if drop_leap_day:
+            keep = ~((times.month == 2) & (times.day == 29))
+            times = times[keep]
+
+        # weather is kept at its native (hourly) resolution, PV production is expanded to the time step afterwards
+        irradiation_data = {}
+        aoi = {} if use_iam else None
+        for sys_id in sys_ids:
+            irradiation_data[sys_id] = (irr['poa_direct'][keep], irr['poa_sky_diffuse'][keep],
+                                        irr['poa_ground_diffuse'][keep], irr['temp_air'][keep])
+            if use_iam:
+                lat, lon = location[sys_id]
+                tilt, azimuth = orientation[sys_id]
+                aoi[sys_id] = compute_aoi(times=times, lat=lat, lon=lon, tilt=tilt, azimuth=azimuth)
+
+        shared_solves.update(compute_pv_outputs(
+            systems={sys_id: systems[sys_id] for sys_id in sys_ids}, irradiation_data=irradiation_data,
+            orientation=orientation, solver=simulation_conf.get("pv_solver", "batch"), aoi=aoi,
+            upsample=int(1 / time_step), upsampling=simulation_conf.get("upsampling", "hold"), dtype=dtype))
+
+    return shared_solves
+
+def annual_energy(series, time_step):
+    """
+    :param series: DataSeries or array --> (kW) power curve, float32 or float64
+    :param time_step: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+    :return: float --> (MWh) energy over the curve, accumulated in float64
+    """
+    return sum(np.asarray(series, dtype=float).tolist()) / 1000 * time_step
+
+def annual_totals(entities, time_step, absolute=False):
+    """
+    :param entities: dict --> {id: obj by Prosumer or Rec}
+    :param time_step: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+    :param absolute: bool --> energy of the absolute value of the curves (e.g. throughput of the battery power)
+    :return: dict --> {id: {carrier: {quantity: MWh}}} energy of every power curve (soc excluded)
+    """
+    return {entity_id: {carrier: {quantity: annual_energy(np.abs(series) if absolute else series, time_step)
+                                  for quantity, series in flows.items() if quantity != 'soc'}
+                        for carrier, flows in entity.en_perf_evolution.items()}
+            for entity_id, entity in entities.items()}
+
+def precision_report(file_path, output_dir, base_path=None, precision='float32'):
+    """
+    runs the simulation in float64 and in the given precision and compares the annual energy of every power curve of
+    prosumers and RECs. The outputs left in output_dir are the ones of the run in the given precision.
+
+    :param file_path: str or Path --> config file, see run
+    :param output_dir: str --> output directory, see run
+    :param base_path: str or Path --> see run
+    :param precision: str --> 'float32' or 'float64'
+    :return: DataFrame --> one row per entity, carrier and quantity: annual energy (MWh) in float64 and in the given
+        precision, absolute deviation and deviation relative to the energy of the absolute value of the float64 curve
+        (signed curves such as the battery power can have a null annual energy)
+    """
+    reference = run(file_path=file_path, output_dir=output_dir, base_path=base_path, precision='float64')
+    result = run(file_path=file_path, output_dir=output_dir, base_path=base_path, precision=precision)
+    time_step = reference[0]['time_step']
+    rows = []
+    for group in ('prosumers', 'recs'):
+        totals_ref = annual_totals(reference[1][group], time_step)
+        totals = annual_totals(result[1][group], time_step)
+        scale = annual_totals(reference[1][group], time_step, absolute=True)
+        for entity_id, carriers in totals_ref.items():
+            for carrier, quantities in carriers.items():
+                for quantity, value_ref in quantities.items():
+                    value = totals[entity_id][carrier][quantity]
+                    deviation = value - value_ref
+                    throughput = scale[entity_id][carrier][quantity]
+                    rows.append({'entity': entity_id, 'carrier': carrier, 'quantity': quantity,
+                                 'float64 (MWh)': value_ref, f'{precision} (MWh)': value, 'deviation (MWh)': deviation,
+                                 'rel_deviation': abs(deviation) / throughput if throughput else abs(deviation)})
+    report = pd.DataFrame(rows)
+    worst = report.loc[report['rel_deviation'].idxmax()] if len(report) else None
+    if worst is not None:
+        logger.info("Precision %s: max. relative deviation of annual energy %.2e (%s %s %s)", precision,
+                    worst['rel_deviation'], worst['entity'], worst['carrier'], worst['quantity'])
+    return report
+
+def economic_risk(entity, risk_conf):
+    """
+    Monte Carlo economic risk of a prosumer or REC (see Prosumer.economic_risk), from the risk section of its economics
+
+    :param entity: obj by Prosumer or Rec, after economic_performance
+    :param risk_conf: dict--> e.g. {'n_draws':100000,'seed':1,'distributions':{'int_rate':{'dist':'uniform','low':0.02,'high':0.05}}}
+    :return: ec_risk: dict
+    """
+    start = time.perf_counter()
+    ec_risk = entity.economic_risk(distributions=risk_conf["distributions"],
+                                   n_draws=risk_conf.get("n_draws", 100000),
+                                   seed=risk_conf.get("seed"),
+                                   chunk_size=risk_conf.get("chunk_size", 20000),
+                                   processes=risk_conf.get("processes"),
+                                   percentiles=risk_conf.get("percentiles", [5, 25, 50, 75, 95]),
+                                   irr=risk_conf.get("irr", False))
+    logger.info("Economic risk %s: %d draws in %.2f s, NPV mean %.0f €, P(NPV<0) %.1f%%", entity.id,
+                ec_risk['n_draws'], time.perf_counter() - start, ec_risk['NPV_mean'], 100 * ec_risk['p_loss'])
+    return ec_risk
+
+
+def run(file_path,output_dir,base_path=None,precision=None):
+    """
+    :param precision: str --> 'float64' or 'float32', dtype of the energy-flow time series (load curves, production
+        curves, prosumer, REC and battery flows), overrides precision in the simulation section of the config (default
+        'float64'). Battery state and annual energy totals are always computed in float64.
+    """
 
     #read yaml docs
     if base_path:
@@ -40,6 +249,13 @@ def run(file_path,output_dir,base_path=None):
     # read simulation parameters
     time_step=time_step_to_hour_fraction(time_step=config_data["simulation"]["time_step"])
     start_date = config_data["simulation"]["start_date"]
+    precision = precision or config_data["simulation"].get("precision", "float64")
+    if precision not in ("float32", "float64"):
+        raise ValueError(f"Unrecognized precision: {precision}")
+    dtype = np.dtype(precision)
+    recording = config_data["simulation"].get("recording", "full")
+    if recording not in BessFleet.recording_levels:
+        raise ValueError(f"Unrecognized recording level: {recording}")
 
     #read demand curve docs
     file_path = config_data["simulation"]["demand_curve_file"]
@@ -48,13 +264,32 @@ def run(file_path,output_dir,base_path=None):
     file_path = file_path.resolve()
     if not file_path.exists():
         raise FileNotFoundError(f"YAML File not found: {file_path}")
-
-
-    df = pd.read_csv(file_path, sep=';')
+    demand_curve_file = file_path
+
+    # optional on-disk cache of the PV module parameters derived from the datasheet
+    module_cache_file = config_data["simulation"].get("module_cache_file")
+    if module_cache_file:
+        module_cache_file = Path(module_cache_file)
+        if base_path:
+            module_cache_file = Path(base_path) / module_cache_file
+        PvPanels.load_module_cache(module_cache_file)
+
+    # weather data store and concurrent fetcher, see WeatherStore and WeatherFetcher
+    weather_conf = config_data["simulation"].get("weather", {})
+    weather_cache_dir = weather_conf.get("cache_dir")
+    if weather_cache_dir and base_path:
+        weather_cache_dir = Path(base_path) / weather_cache_dir
+    weather_store = WeatherStore(cache_dir=weather_cache_dir, offline=weather_conf.get("offline", False),
+                                 grid=weather_conf.get("grid", 0.05))
+    weather_fetcher = WeatherFetcher(store=weather_store, max_workers=weather_conf.get("max_workers", 8),
+                                     rate=weather_conf.get("rate", 10), retries=weather_conf.get("retries", 3),
+                                     backoff=weather_conf.get("backoff", 1))
 
     #generate system
     systems = {}
-    irradiation_data = {}
+    weather_requests = {}
+    location = {}
+    orientation = {}
     for system in config_data["systems"]:
         for sys_id, sys_conf in system.items():
             tech = sys_conf["tech"]
@@ -64,26 +299,13 @@ def run(file_path,output_dir,base_path=None):
             lon = tech["lon"]
             tilt = tech["tilt"]
             azimuth= tech["azimuth"]
-            irr = pvlib.iotools.pvgis.get_pvgis_hourly(
-                lat, lon, start=2019, end=2019,
-                raddatabase='PVGIS-SARAH2',
-                surface_tilt=tilt,
-                surface_azimuth=azimuth,
-                outputformat='csv',
-                pvcalculation=True,
-                peakpower=0.4,
-                loss=14,
-                url='https://re.jrc.ec.europa.eu/api/v5_2/'
-            )[0]
-
-            I_beam, I_skydiff, I_grounddiff, t_amb = [], [], [], []
-            for e, e1, e2, e3 in zip(irr['poa_direct'], irr['poa_sky_diffuse'], irr['poa_ground_diffuse'], irr['temp_air']):
-                I_beam.extend([e] * int(1 / time_step))
-                I_skydiff.extend([e1] * int(1 / time_step))
-                I_grounddiff.extend([e2] * int(1 / time_step))
-                t_amb.extend([e3] * int(1 / time_step))
-
-            irradiation_data[sys_id] = (I_beam, I_skydiff, I_grounddiff, t_amb)
+            weather_requests[sys_id] = {'lat': lat, 'lon': lon, 'tilt': tilt, 'azimuth': azimuth,
+                                        'database': weather_conf.get("database", "PVGIS-SARAH2"),
+                                        'start': weather_conf.get("start_year", 2019),
+                                        'end': weather_conf.get("end_year", 2019),
+                                        'url': weather_conf.get("url", PVGIS_URL)}
+            location[sys_id] = (lat, lon)
+            orientation[sys_id] = (tilt, azimuth)
 
             systems[sys_id] = PvPanels(
                 id=sys_id,
@@ -98,27 +320,36 @@ def run(file_path,output_dir,base_path=None):
                 n_parallel=tech["n_parallel"],
             )
 
-    for sys_id, obj in systems.items():
-        for system in config_data["systems"]:
-            if sys_id in system:
-                tilt = system[sys_id]["tech"]["tilt"]
-                break
+    if module_cache_file:
+        PvPanels.save_module_cache(module_cache_file)
 
-        I_beam, I_skydiff, I_grounddiff, t_amb = irradiation_data[sys_id]
-        obj.compute_output(slope=tilt, theta=None, I_beam=I_beam, I_skydiff=I_skydiff,
-                           I_grounddiff=I_grounddiff, t_amb=t_amb)
+    # weather years: a single request from start_year to end_year or, when years: [first, last] is set, one
+    # simulation per weather year, each reduced to annual energy flows before moving to the next one
+    years = weather_conf.get("years")
+    years = list(range(years[0], years[1] + 1)) if years else [None]
 
-    # generate consumers
-    consumers = {}
+    # generate consumers, their load curves are rows of a shared demand matrix (users x time, one per carrier) read
+    # from the referenced columns of the demand curve file only, or mapped from its binary sidecars
+    demand_columns = {}
     for cons in config_data["users"]:
         for cons_id, cons_conf in cons.items():
-            dem={}
-            for carrier in cons_conf["carriers"]:
-                column=cons_conf["carriers"][carrier]["column"]
-                dem[carrier] =  df[column]
+            demand_columns[cons_conf["id"]] = {carrier: carrier_conf["column"]
+                                               for carrier, carrier_conf in cons_conf["carriers"].items()}
+    # binary cache of the demand matrices, in the output directory unless demand_cache_dir is given
+    demand_cache_dir = None
+    if config_data["simulation"].get("demand_cache", True):
+        demand_cache_dir = config_data["simulation"].get("demand_cache_dir")
+        if demand_cache_dir and base_path:
+            demand_cache_dir = Path(base_path) / demand_cache_dir
+        demand_cache_dir = demand_cache_dir or Path(output_dir) / "demand_cache"
+    demand_matrix = DemandMatrix.from_csv(file_path=demand_curve_file, users=demand_columns,
+                                          cache_dir=demand_cache_dir, dtype=dtype)
 
+    consumers = {}
+    for cons in config_data["users"]:
+        for cons_id, cons_conf in cons.items():
             consumers[cons_id] = Consumer(
-                id=cons_conf["id"],dem=dem)
+                id=cons_conf["id"], matrix=demand_matrix)
 
     #generate bess
     bess_storage = {}
@@ -167,32 +398,11 @@ def run(file_path,output_dir,base_path=None):
                 users=prosumer_consumers,
                 systems=prosumer_systems ,
                 bess= prosumer_bess,
-                carriers=tech["carriers"]
+                carriers=tech["carriers"],
+                aggregate_bess=config_data["simulation"].get("aggregate_bess", False),
+                recording=recording
             )
 
-            pros_obj=prosumers[pros_id]
-            pros_obj.energy_performance(time=time_step)
-
-
-            flows_and_prices={}
-            for carrier in tech['carriers']:
-
-                flows_and_prices[carrier] =  {
-                        "sold": sum(pros_obj.en_perf_evolution[carrier]["surplus"]) / 1000 * time_step,
-                        "self_cons": sum(pros_obj.en_perf_evolution[carrier]["self_cons"]) / 1000 * time_step,
-                        "purchased": 0,
-                        "price_sold":  econ['carriers_and_costs'][carrier]['price_sold'],
-                        "price_buy":   econ['carriers_and_costs'][carrier]['price_buy'],
-                        "decay": econ['carriers_and_costs'][carrier]['decay']
-                    }
-
-            pros_obj.economic_performance(
-                time_horizon=config_data['simulation']["time_horizon"],
-                tax_rate=econ["tax_rate"],
-                int_rate=econ["int_rate"],
-                other_capex_perc=econ["other_capex_perc"],
-                annual_en_flows_and_price=flows_and_prices
-            )
 
     #generate recs
     recs = {}
@@ -211,113 +421,202 @@ def run(file_path,output_dir,base_path=None):
                 consumers=rec_consumers,
                 rec_systems=rec_systems,
                 rec_bess=rec_bess,
-                carriers=tech["carriers"]
+                carriers=tech["carriers"],
+                aggregate_bess=config_data["simulation"].get("aggregate_bess", False),
+                recording=recording
             )
 
-            rec_obj=recs[rec_id]
 
-            out_en_rec = rec_obj.energy_performance(time=time_step)
-
-            flows_and_prices = {}
-            for carrier in tech['carriers']:
-                flows_and_prices[carrier] = {
-                    "sold": sum(rec_obj.en_perf_evolution[carrier]["prod_rec"]) / 1000 * time_step,
-                    "self_cons": sum(rec_obj.en_perf_evolution[carrier]["shared"]) / 1000 * time_step,
-                    "purchased": 0,
-                    "price_sold": econ['carriers_and_costs'][carrier]['price_sold'],
-                    "price_buy": econ['carriers_and_costs'][carrier]['price_buy'],
-                    "decay": econ['carriers_and_costs'][carrier]['decay']
-                }
-
-
-            out_ec_rec = rec_obj.economic_performance(
-                time_horizon=config_data['simulation']["time_horizon"],
-                tax_rate=econ["tax_rate"],
-                int_rate=econ["int_rate"],
-                other_capex_perc=econ["other_capex_perc"],
-                annual_en_flows_and_price=flows_and_prices
-            )
-
-    #generate csv files
-    rec_dfs = []
-    for rec_id, rec_obj in recs.items():
-        for carrier, perf_dict in rec_obj.en_perf_evolution.items():
-            temp_df = pd.DataFrame(perf_dict)
-            temp_df.columns = [f"{rec_id}_{carrier}_{col}" for col in temp_df.columns]
-            rec_dfs.append(temp_df)
-    rec_result = pd.concat(rec_dfs, axis=1)
-
-    n_rows = rec_result.shape[0]
+    # energy performance, year by year
+    pv_shared_solves = {}
+    pros_flows = {}  # {pros_id: {carrier: {'sold': [kWh/year], 'self_cons': [kWh/year]}}}
+    rec_flows = {}  # {rec_id: {carrier: {'sold': [kWh/year], 'self_cons': [kWh/year]}}}
+    for year in years:
+        if year is None:
+            requests_year = weather_requests
+        else:
+            requests_year = {sys_id: dict(request, start=year, end=year) for sys_id, request in weather_requests.items()}
+        pv_shared_solves.update(simulate_pv(systems=systems, weather_fetcher=weather_fetcher,
+                                            weather_requests=requests_year, location=location, orientation=orientation,
+                                            simulation_conf=config_data["simulation"], time_step=time_step,
+                                            drop_leap_day=year is not None, dtype=dtype))
+        if year is not None:
+            weather_store.memory.clear()
+
+        for pros_id, pros_obj in prosumers.items():
+            pros_obj.energy_performance(time=time_step)
+            for carrier in pros_obj.carriers:
+                flows = pros_flows.setdefault(pros_id, {}).setdefault(carrier, {'sold': [], 'self_cons': []})
+                flows['sold'].append(annual_energy(pros_obj.en_perf_evolution[carrier]["surplus"], time_step))
+                flows['self_cons'].append(annual_energy(pros_obj.en_perf_evolution[carrier]["self_cons"], time_step))
+
+        for rec_id, rec_obj in recs.items():
+            rec_obj.energy_performance(time=time_step)
+            for carrier in rec_obj.carriers:
+                flows = rec_flows.setdefault(rec_id, {}).setdefault(carrier, {'sold': [], 'self_cons': []})
+                flows['sold'].append(annual_energy(rec_obj.en_perf_evolution[carrier]["prod_rec"], time_step))
+                flows['self_cons'].append(annual_energy(rec_obj.en_perf_evolution[carrier]["shared"], time_step))
+
+    # report of the aggregation of identical batteries (aggregate_bess), returned in simulation['bess_aggregation']
+    bess_aggregation = {}
+    for entity in list(prosumers.values()) + list(recs.values()):
+        aggregation = entity.bess_aggregation
+        if aggregation:
+            bess_aggregation[entity.id] = aggregation
+        for ids, attrs in aggregation.get('mismatches', {}).items():
+            diff = ', '.join(f"{attr} {value} != {ref}" for attr, (value, ref) in attrs.items())
+            logger.info("BESS aggregation of %s: batteries %s not merged with %s (%s)", entity.id, list(ids),
+                        aggregation['groups'][0], diff)
+        for violation in aggregation.get('violations', []):
+            logger.warning("BESS aggregation of %s: not equivalent, %s", entity.id, violation)
+
+    # all the time series of prosumers and RECs in a single block, the en_perf_evolution of each entity refers to it
+    results = Results.from_components({'prosumers': prosumers, 'recs': recs})
+    n_rows = results.block.shape[1]
     timeline = pd.date_range(
         start=start_date,
         periods=n_rows,
         freq=config_data["simulation"]["time_step"]
     )
-    rec_result.insert(0, 'date', timeline)
-    rec_result.to_csv(f'{output_dir}/recs_en_perf_evolution_kW.csv', index=False)
-    pros_dfs = []
-    for pros_id, pros_obj in prosumers.items():
-        for carrier, perf_dict in pros_obj.en_perf_evolution.items():
-            temp_df = pd.DataFrame(perf_dict)
-            temp_df.columns = [f"{pros_id}_{carrier}_{col}" for col in temp_df.columns]
-            pros_dfs.append(temp_df)
-    pros_result = pd.concat(pros_dfs, axis=1)
-    pros_result.insert(0, 'date', timeline)
-    pros_result.to_csv(f'{output_dir}/prosumers_en_perf_evolution_kW.csv', index=False)
-
-
-    all_data = {}
-    max_len = 0
-    for rec_id, rec_obj in recs.items():
-        ec_perf = rec_obj.ec_perf
-        for k, v in ec_perf.items():
-            col_name = f"{rec_id}_{k}"
-            if isinstance(v, (list, np.ndarray)):
-                v = list(v)
-            else:
-                v = [v]
-            all_data[col_name] = v
-            if len(v) > max_len:
-                max_len = len(v)
-
-    for col in all_data:
-        if len(all_data[col]) < max_len:
-            all_data[col] += [None] * (max_len - len(all_data[col]))
-
-    rename_map = {}
-    for rec_id in recs.keys():
-        old_name = f"{rec_id}_rev_savings"
-        new_name = f"{rec_id}_rev_inc_on_shared"
-        if old_name in all_data:
-            rename_map[old_name] = new_name
-
-    df = pd.DataFrame(all_data)
-    df = df.rename(columns=rename_map)
-    df.to_excel(f'{output_dir}/recs_ec_perf_€.xlsx', index=False)
-    rec_result_ec=df
-
-    all_data_pros = {}
-    max_len = 0
-    for pros_id, pros_obj in prosumers.items():
-        ec_perf = pros_obj.ec_perf
-        for k, v in ec_perf.items():
-            col_name = f"{pros_id}_{k}"
-            if isinstance(v, (list, np.ndarray)):
-                v = list(v)
-            else:
-                v = [v]
-            all_data_pros[col_name] = v
-            if len(v) > max_len:
-                max_len = len(v)
-
-    for col in all_data_pros:
-        if len(all_data_pros[col]) < max_len:
-            all_data_pros[col] += [None] * (max_len - len(all_data_pros[col]))
-
-    df = pd.DataFrame(all_data_pros)
-    df.to_excel(f'{output_dir}/prosumers_ec_perf_€.xlsx', index=False)
-    pros_result_ec = df
-    simulation = {'time_step': time_step, 'timeline': timeline,'start_date':start_date}
+    results.timeline = timeline
+
+    # output files, written by a background thread while the economic performance is computed (see ResultWriter)
+    output_conf = config_data["simulation"].get("output", {})
+    with ResultWriter(output_dir=output_dir, formats=output_conf.get("formats", ["csv", "excel"]),
+                      background=output_conf.get("background", True),
+                      compression=output_conf.get("compression", "gzip")) as writer:
+        writer.write_series('recs_en_perf_evolution_kW', results, entities=results.entities('recs'))
+        writer.write_series('prosumers_en_perf_evolution_kW', results, entities=results.entities('prosumers'))
+        rec_result = results.frame(entity=results.entities('recs'), names='flat').reset_index()
+        pros_result = results.frame(entity=results.entities('prosumers'), names='flat').reset_index()
+
+        # economic performance, with the annual flows of each weather year (single value with a single weather request)
+        for pros in config_data["prosumers"]:
+            for pros_id, pros_conf in pros.items():
+                tech = pros_conf["tech"]
+                econ = pros_conf["economics"]
+                pros_obj = prosumers[pros_id]
+
+                flows_and_prices={}
+                for carrier in tech['carriers']:
+                    flows = pros_flows[pros_id][carrier]
+                    flows_and_prices[carrier] =  {
+                            "sold": flows['sold'] if len(years) > 1 else flows['sold'][0],
+                            "self_cons": flows['self_cons'] if len(years) > 1 else flows['self_cons'][0],
+                            "purchased": 0,
+                            "price_sold":  econ['carriers_and_costs'][carrier]['price_sold'],
+                            "price_buy":   econ['carriers_and_costs'][carrier]['price_buy'],
+                            "decay": econ['carriers_and_costs'][carrier]['decay']
+                        }
+
+                pros_obj.economic_performance(
+                    time_horizon=config_data['simulation']["time_horizon"],
+                    tax_rate=econ["tax_rate"],
+                    int_rate=econ["int_rate"],
+                    other_capex_perc=econ["other_capex_perc"],
+                    annual_en_flows_and_price=flows_and_prices
+                )
+                if econ.get("risk"):
+                    economic_risk(pros_obj, econ["risk"])
+
+        for rec in config_data["rec"]:
+            for rec_id, rec_conf in rec.items():
+                tech = rec_conf["tech"]
+                econ = rec_conf["economics"]
+                rec_obj = recs[rec_id]
+
+                flows_and_prices = {}
+                for carrier in tech['carriers']:
+                    flows = rec_flows[rec_id][carrier]
+                    flows_and_prices[carrier] = {
+                        "sold": flows['sold'] if len(years) > 1 else flows['sold'][0],
+                        "self_cons": flows['self_cons'] if len(years) > 1 else flows['self_cons'][0],
+                        "purchased": 0,
+                        "price_sold": econ['carriers_and_costs'][carrier]['price_sold'],
+                        "price_buy": econ['carriers_and_costs'][carrier]['price_buy'],
+                        "decay": econ['carriers_and_costs'][carrier]['decay']
+                    }
+
+                rec_obj.economic_performance(
+                    time_horizon=config_data['simulation']["time_horizon"],
+                    tax_rate=econ["tax_rate"],
+                    int_rate=econ["int_rate"],
+                    other_capex_perc=econ["other_capex_perc"],
+                    annual_en_flows_and_price=flows_and_prices
+                )
+                if econ.get("risk"):
+                    economic_risk(rec_obj, econ["risk"])
+
+
+
+        all_data = {}
+        max_len = 0
+        for rec_id, rec_obj in recs.items():
+            ec_perf = rec_obj.ec_perf
+            for k, v in ec_perf.items():
+                col_name = f"{rec_id}_{k}"
+                if isinstance(v, (list, np.ndarray)):
+                    v = list(v)
+                else:
+                    v = [v]
+                all_data[col_name] = v
+                if len(v) > max_len:
+                    max_len = len(v)
+
+        for col in all_data:
+            if len(all_data[col]) < max_len:
+                all_data[col] += [None] * (max_len - len(all_data[col]))
+
+        rename_map = {}
+        for rec_id in recs.keys():
+            old_name = f"{rec_id}_rev_savings"
+            new_name = f"{rec_id}_rev_inc_on_shared"
+            if old_name in all_data:
+                rename_map[old_name] = new_name
+
+        df = pd.DataFrame(all_data)
+        df = df.rename(columns=rename_map)
+        writer.write_table('recs_ec_perf_€', df)
+        rec_result_ec=df
+
+        all_data_pros = {}
+        max_len = 0
+        for pros_id, pros_obj in prosumers.items():
+            ec_perf = pros_obj.ec_perf
+            for k, v in ec_perf.items():
+                col_name = f"{pros_id}_{k}"
+                if isinstance(v, (list, np.ndarray)):
+                    v = list(v)
+                else:
+                    v = [v]
+                all_data_pros[col_name] = v
+                if len(v) > max_len:
+                    max_len = len(v)
+
+        for col in all_data_pros:
+            if len(all_data_pros[col]) < max_len:
+                all_data_pros[col] += [None] * (max_len - len(all_data_pros[col]))
+
+        df = pd.DataFrame(all_data_pros)
+        writer.write_table('prosumers_ec_perf_€', df)
+        pros_result_ec = df
+
+        # Monte Carlo economic risk of the prosumers and RECs with a risk section in their economics
+        ec_risk = {'recs': {rec_id: rec_obj.ec_risk for rec_id, rec_obj in recs.items() if rec_obj.ec_risk},
+                   'prosumers': {pros_id: pros_obj.ec_risk for pros_id, pros_obj in prosumers.items()
+                                 if pros_obj.ec_risk}}
+        for group, risks in ec_risk.items():
+            if risks:
+                df = pd.DataFrame({f"{entity_id}_{k}": [v] for entity_id, risk in risks.items()
+                                   for k, v in risk.items()})
+                writer.write_table(f'{group}_ec_risk_€', df)
+    output_files = writer.written
+    weather_cache = weather_store.report()
+    logger.info("Weather cache: %d hits, %d misses", weather_cache['hits'], weather_cache['misses'])
+    simulation = {'time_step': time_step, 'timeline': timeline,'start_date':start_date, 'precision': precision,
+                  'pv_shared_solves': pv_shared_solves, 'weather_cache': weather_cache,
+                  'bess_aggregation': bess_aggregation, 'results': results,
+                  'output_files': output_files, 'ec_risk': ec_risk}
     all_components = {'recs':recs,'prosumers':prosumers,'consumers':consumers,'systems':systems,'bess':bess_storage}
 
     return simulation,all_components,rec_result, pros_result, rec_result_ec,pros_result_ec
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import pvlib
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import requests
+import threading
+import hashlib
+import json
+import time
+import io
+import os
+
+PVGIS_URL = 'https://re.jrc.ec.europa.eu/api/v5_2/'
+WEATHER_COLUMNS = ['poa_direct', 'poa_sky_diffuse', 'poa_ground_diffuse', 'temp_air']
+
+
+class WeatherStore:
+    def __init__(self, cache_dir=None, offline=False, grid=0.05):
+        """
+        content-addressed store of the PVGIS hourly data. Each request is identified by (lat, lon rounded to the PVGIS
+        grid, tilt, azimuth, database, years, API url): the parsed series are saved as binary .npy files named after the hash of
+        the request and loaded by memory mapping, so that repeated runs do not query PVGIS and runs can be performed
+        offline from a pre-seeded cache_dir.
+
+        :param cache_dir: str or Path --> directory of the binary files, None to keep the data in memory only
+        :param offline: bool --> when True PVGIS is never queried and missing data raise FileNotFoundError
+        :param grid: float --> (°) resolution of the PVGIS database used to round lat and lon e.g. 0.05 for PVGIS-SARAH2
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.offline = offline
+        self.grid = grid
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def request_params(self, lat, lon, tilt, azimuth, database, start, end, url=PVGIS_URL):
+        """
+        :return: dict --> canonical request parameters, lat and lon are rounded to the PVGIS grid
+        """
+        return {'lat': round(round(lat / self.grid) * self.grid, 6), 'lon': round(round(lon / self.grid) * self.grid, 6),
+                'tilt': tilt, 'azimuth': azimuth, 'database': database, 'start': start, 'end': end, 'url': url}
+
+    def key(self, lat, lon, tilt, azimuth, database, start, end, url=PVGIS_URL):
+        """
+        :return: str --> hash of the canonical request parameters
+        """
+        params = self.request_params(lat, lon, tilt, azimuth, database, start, end, url)
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        :param key: str --> request hash
+        :return: dict --> {'time': DatetimeIndex, 'poa_direct': array, ...} or None if the request is not stored
+        """
+        if key in self.memory:
+            return self.memory[key]
+        if self.cache_dir is None or not (self.cache_dir / f"{key}.npy").exists():
+            return None
+        values = np.load(self.cache_dir / f"{key}.npy", mmap_mode='r')
+        time = np.load(self.cache_dir / f"{key}_time.npy")
+        data = {'time': pd.to_datetime(time, utc=True)}
+        for i, column in enumerate(WEATHER_COLUMNS):
+            data[column] = values[i]
+        self.memory[key] = data
+        return data
+
+    def save(self, key, data, params=None):
+        """
+        stores the series of a request
+        :param key: str --> request hash
+        :param data: dict --> {'time': DatetimeIndex, 'poa_direct': array, ...}
+        :param params: dict --> request parameters, written next to the data for reference
+        """
+        self.memory[key] = data
+        if self.cache_dir is None:
+            return
+        values = np.vstack([np.asarray(data[column], dtype=float) for column in WEATHER_COLUMNS])
+        index = pd.DatetimeIndex(data['time'])
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        time = index.as_unit('ns').asi8
+        for suffix, array in [('_time', time), ('', values)]:
+            tmp = self.cache_dir / f"{key}{suffix}.tmp.npy"
+            np.save(tmp, array)
+            os.replace(tmp, self.cache_dir / f"{key}{suffix}.npy")
+        if params is not None:
+            with open(self.cache_dir / f"{key}.json", "w") as file:
+                json.dump(params, file)
+
+    def fetch(self, lat, lon, tilt, azimuth, database, start, end, url=PVGIS_URL, session=None, timeout=30):
+        """
+        queries PVGIS with the same request of pvlib.iotools.pvgis.get_pvgis_hourly
+        :param session: requests.Session --> session used for the query (e.g. with a connection pool), None for a single request
+        :param timeout: float --> (s) request timeout
+        :return: dict --> {'time': DatetimeIndex, 'poa_direct': array, ...}
+        """
+        params = {'lat': lat, 'lon': lon, 'outputformat': 'csv', 'angle': tilt, 'aspect': azimuth - 180,
+                  'pvcalculation': 1, 'pvtechchoice': 'crystSi', 'mountingplace': 'free', 'trackingtype': 0,
+                  'components': 1, 'usehorizon': 1, 'optimalangles': 0, 'optimalinclination': 0, 'loss': 14,
+                  'raddatabase': database, 'startyear': start, 'endyear': end, 'peakpower': 0.4}
+        res = (session or requests).get(url + 'seriescalc', params=params, timeout=timeout)
+        # PVGIS returns its error messages in JSON
+        if not res.ok:
+            try:
+                err_msg = res.json()
+            except Exception:
+                res.raise_for_status()
+            else:
+                message = err_msg.get('message', res.text) if isinstance(err_msg, dict) else res.text
+                raise requests.HTTPError(message, response=res)
+
+        irr = pvlib.iotools.read_pvgis_hourly(io.StringIO(res.text), pvgis_format='csv')[0]
+        data = {'time': irr.index}
+        for column in WEATHER_COLUMNS:
+            data[column] = irr[column].to_numpy()
+        return data
+
+    def get(self, lat, lon, tilt, azimuth, database='PVGIS-SARAH2', start=2019, end=2019, url=PVGIS_URL):
+        """
+        hourly weather data of a PV array, from the store if available, otherwise from PVGIS
+
+        :param lat: float --> (°) latitude
+        :param lon: float --> (°) longitude
+        :param tilt: float --> (°) slope of the array
+        :param azimuth: float --> (°) azimuth of the array, same convention of pvlib.iotools.pvgis.get_pvgis_hourly
+        :param database: str --> PVGIS radiation database
+        :param start: int --> first year
+        :param end: int --> last year
+        :param url: str --> PVGIS API url
+        :return: dict --> {'time': DatetimeIndex, 'poa_direct': array, 'poa_sky_diffuse': array,
+                 'poa_ground_diffuse': array, 'temp_air': array}
+        """
+        key = self.key(lat, lon, tilt, azimuth, database, start, end, url)
+        data = self.load(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        if self.offline:
+            params = self.request_params(lat, lon, tilt, azimuth, database, start, end, url)
+            raise FileNotFoundError(f"Weather data not found in {self.cache_dir} for {params} (offline mode)")
+        data = self.fetch(lat, lon, tilt, azimuth, database, start, end, url=url)
+        self.save(key, data, params=self.request_params(lat, lon, tilt, azimuth, database, start, end, url))
+        return data
+
+    def report(self):
+        """
+        :return: dict --> {'hits': int, 'misses': int}
+        """
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class WeatherFetcher:
+    def __init__(self, store, max_workers=8, rate=10, retries=3, backoff=1, timeout=30):
+        """
+        fetches the weather data of many PV arrays concurrently: requests are deduplicated, served from the store when
+        possible, otherwise sent to PVGIS by a pool of worker threads sharing a bounded connection pool, with per-host
+        rate limiting and retries with exponential backoff on connection errors, timeouts and HTTP 429/5xx answers.
+
+        :param store: obj by WeatherStore --> store of the fetched data
+        :param max_workers: int --> max. number of concurrent requests (and pooled connections per host)
+        :param rate: float --> max. number of requests per second sent to each host
+        :param retries: int --> max. number of retries of a failed request
+        :param backoff: float --> (s) delay before the first retry, doubled at each retry
+        :param timeout: float --> (s) request timeout
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.next_slot = {}  # {host: earliest start time of the next request}
+
+    def wait_slot(self, url):
+        """
+        blocks until a request to the host of url is allowed by the rate limit
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + 1 / self.rate
+        time.sleep(max(0, slot - now))
+
+    def fetch(self, request):
+        """
+        :param request: dict --> keyword arguments of WeatherStore.fetch
+        :return: dict --> {'time': DatetimeIndex, 'poa_direct': array, ...}
+        """
+        for attempt in range(self.retries + 1):
+            self.wait_slot(request['url'])
+            try:
+                return self.store.fetch(**request, session=self.session, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+                response = getattr(error, 'response', None)
+                retry = response is None or response.status_code == 429 or response.status_code >= 500
+                if not retry or attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch_all(self, requests_by_id):
+        """
+        yields the weather data of each request as soon as it is available, identical requests are fetched once
+
+        :param requests_by_id: dict --> {id: {'lat':..,'lon':..,'tilt':..,'azimuth':..,'database':..,'start':..,'end':..,'url':..}}
+        :return: generator of (ids, data): ids: list of the ids sharing the request, data: dict as returned by WeatherStore.get
+        """
+        groups = {}
+        for request_id, request in requests_by_id.items():
+            key = self.store.key(request['lat'], request['lon'], request['tilt'], request['azimuth'],
+                                 request['database'], request['start'], request['end'], request['url'])
+            groups.setdefault(key, []).append(request_id)
+
+        missing = {}
+        for key, ids in groups.items():
+            data = self.store.load(key)
+            if data is not None:
+                self.store.hits += 1
+                yield ids, data
+            else:
+                self.store.misses += 1
+                missing[key] = ids
+
+        if missing and self.store.offline:
+            request = requests_by_id[next(iter(missing.values()))[0]]
+            params = self.store.request_params(request['lat'], request['lon'], request['tilt'], request['azimuth'],
+                                               request['database'], request['start'], request['end'],
+                                               request['url'])
+            raise FileNotFoundError(f"Weather data not found in {self.store.cache_dir} for {params} (offline mode)")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, requests_by_id[ids[0]]): key for key, ids in missing.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                request = requests_by_id[missing[key][0]]
+                data = future.result()
+                self.store.save(key, data, params=self.store.request_params(
+                    request['lat'], request['lon'], request['tilt'], request['azimuth'], request['database'],
+                    request['start'], request['end'], request['url']))
+                yield missing[key], data
@@ -4,6 +4,7 @@ Created on June 5 08:00:00 2025
 @author: isabella pizzuti
 """
 
+import numpy as np
 from src.rec_sim.System import System
 
 class Bess(System):
@@ -194,3 +195,124 @@ class Bess(System):
 
 
         return power_in,soc, stored, supply, power, surplus, deficit, current,mode
+
+    def energy_performance_series(self, power_in, time):
+        """
+        whole-horizon version of energy_performance: the battery is simulated over the full net power series in a
+        single call, starting from soc_in, by the step recursion (series_recursion) with the same results of
+        energy_performance step by step.
+
+        :param power_in: DataSeries or array--> input power to battery (kW)
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: dict--> {'power_in', 'soc', 'stored', 'supply', 'power', 'surplus', 'deficit', 'current', 'case'},
+            series of the outputs of energy_performance, also stored in en_perf_evolution. soc_in is set to the final
+            state of charge.
+        """
+        power_in = np.asarray(power_in, dtype=float)
+        energy_in = power_in * time
+        energy_min = self.v * time * self.i_min / 1000
+        energy_max = self.v * time * self.i_max / 1000
+
+        soc, battery, current, mode = self.series_recursion(energy_in=energy_in, time=time, energy_min=energy_min,
+                                                            energy_max=energy_max)
+
+        charging = energy_in > 0
+        series = {
+            'power_in': power_in,
+            'soc': soc,
+            'stored': np.where(charging, battery, 0) / time,
+            'supply': np.where(charging, 0, -battery) / time,
+            'power': battery / time,
+            'surplus': np.where(charging, energy_in - battery, 0) / time,
+            'deficit': np.where(charging, 0, -energy_in + battery) / time,
+            'current': current,
+            'case': mode
+        }
+        self.en_perf_evolution.update(series)
+        if len(soc):
+            self.soc_in = float(soc[-1])
+        return series
+
+    def series_recursion(self, energy_in, time, energy_min, energy_max):
+        """
+        step by step operation of energy_performance, with the per-step constants computed once
+
+        :param energy_in: array--> input energy to battery (kWh)
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :param energy_min: float--> min. energy exchanged in a time step (kWh)
+        :param energy_max: float--> max. energy exchanged in a time step (kWh)
+        :return: soc, battery (energy exchanged, (+) charge (-) discharge, kWh), current (A), mode: arrays
+        """
+        cap = self.cap
+        soc_max = self.soc_max
+        soc_min = self.soc_min
+        i_max = self.i_max
+        k_current = time * self.v
+        n = len(energy_in)
+        soc_ev = [0.0] * n
+        battery_ev = [0.0] * n
+        current_ev = [0.0] * n
+        mode_ev = [0] * n
+
+        soc = self.soc_in
+        for t, energy in enumerate(energy_in.tolist()):
+            if energy > 0:
+                if soc < soc_max:
+                    avaliability = cap * (soc_max - soc)
+                    if energy >= avaliability:
+                        charge = avaliability
+                        mode = 0
+                    else:
+                        charge = energy
+                        mode = 3
+                    if charge > energy_max:
+                        charge = energy_max
+                        current = i_max
+                        mode += 1
+                    elif charge < energy_min:
+                        charge = 0
+                        current = 0
+                        mode += 2
+                    else:
+                        current = charge * 1000 / k_current
+                        mode += 3
+                else:
+                    charge = 0
+                    current = 0
+                    mode = 7
+                battery = charge
+            else:
+                energy_out = -energy
+                if soc >= soc_min:
+                    avaliability = cap * (soc - soc_min)
+                    if energy_out >= avaliability:
+                        discharge = avaliability
+                        mode = 7
+                    else:
+                        discharge = energy_out
+                        mode = 10
+                    if discharge > energy_max:
+                        discharge = energy_max
+                        current = i_max
+                        mode += 1
+                    elif discharge < energy_min:
+                        discharge = 0
+                        current = 0
+                        mode += 2
+                    else:
+                        current = discharge * 1000 / k_current
+                        mode += 3
+                else:
+                    discharge = 0
+                    current = 0
+                    mode = 14
+                battery = -discharge
+
+            soc = (cap * soc + battery) / cap
+            soc_ev[t] = soc
+            battery_ev[t] = battery
+            current_ev[t] = current
+            mode_ev[t] = mode
+
+        return np.array(soc_ev, dtype=float), np.array(battery_ev, dtype=float), np.array(current_ev, dtype=float), \
+            np.array(mode_ev, dtype=float)
@@ -0,0 +1,117 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import numpy as np
+
+class BessBatch:
+    def __init__(self, scenarios):
+        """
+        several battery configurations (scenarios) dispatched against the same net power in a single time loop, e.g.
+        for battery sizing. Parameters and state are arrays (scenario x battery) and every step is computed for all
+        scenarios at once, with the operation of BessFleet.
+
+        :param scenarios: list of list of obj by Bess--> one list of batteries per scenario, all scenarios with the
+            same number of batteries, e.g. [[bess_10kWh], [bess_20kWh], [bess_30kWh]]
+        """
+        n_bess = {len(fleet) for fleet in scenarios}
+        if len(n_bess) != 1 or 0 in n_bess:
+            raise ValueError("all scenarios must have the same (non zero) number of batteries")
+
+        self.scenarios = scenarios
+        self.cap = np.array([[battery.cap for battery in fleet] for fleet in scenarios], dtype=float)
+        self.soc_max = np.array([[battery.soc_max for battery in fleet] for fleet in scenarios], dtype=float)
+        self.soc_min = np.array([[battery.soc_min for battery in fleet] for fleet in scenarios], dtype=float)
+        self.v = np.array([[battery.v for battery in fleet] for fleet in scenarios], dtype=float)
+        self.i_max = np.array([[battery.i_max for battery in fleet] for fleet in scenarios], dtype=float)
+        self.i_min = np.array([[battery.i_min for battery in fleet] for fleet in scenarios], dtype=float)
+        self.soc = np.array([[battery.soc_in for battery in fleet] for fleet in scenarios], dtype=float)
+
+    def energy_performance(self, power_in, time):
+        """
+        dispatches the net power among the batteries of each scenario, as BessFleet.energy_performance (same dispatch
+        order and operation, same results scenario by scenario). Only the totals of each scenario are recorded.
+
+        :param power_in: array--> net power, production - demand (kW)
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: arrays (scenario x time step), in the dtype of power_in (float32 or float64):
+                stored_tot_ev (kW)
+                supply_tot_ev (kW)
+                power_tot_ev (kW)
+                soc_tot_ev
+        """
+        power_in = np.asarray(power_in)
+        dtype = np.result_type(np.float32, power_in.dtype)
+        power_in = power_in.astype(float, copy=False)
+        len_ref = len(power_in)
+        n_scenarios, n_bess = self.cap.shape
+        rows = np.arange(n_scenarios)
+
+        stored_tot_ev = np.zeros((n_scenarios, len_ref), dtype=dtype)
+        supply_tot_ev = np.zeros((n_scenarios, len_ref), dtype=dtype)
+        power_tot_ev = np.zeros((n_scenarios, len_ref), dtype=dtype)
+        soc_tot_ev = np.zeros((n_scenarios, len_ref), dtype=dtype)
+
+        energy_min = self.v * time * self.i_min / 1000
+        energy_max = self.v * time * self.i_max / 1000
+        soc = self.soc
+        den = 0
+        for k in range(n_bess):
+            den = den + self.cap[:, k]
+
+        # parameters of the battery at each dispatch rank, gathered again only when the order changes
+        order = np.tile(np.arange(n_bess), (n_scenarios, 1))
+        ranked = None
+
+        for i, p in enumerate(power_in.tolist()):
+            charging = p > 0
+            if n_bess > 1:
+                new_order = np.argsort(soc if charging else -soc, axis=1, kind='stable')
+                if ranked is not None and not np.array_equal(new_order, order):
+                    ranked = None
+                order = new_order
+            if ranked is None:
+                ranked = [(order[:, r], self.cap[rows, order[:, r]], self.soc_max[rows, order[:, r]],
+                           self.soc_min[rows, order[:, r]], energy_min[rows, order[:, r]],
+                           energy_max[rows, order[:, r]]) for r in range(n_bess)]
+
+            p_in = np.full(n_scenarios, p)
+            stored_tot = np.zeros(n_scenarios)
+            supply_tot = np.zeros(n_scenarios)
+            for k, cap, soc_max, soc_min, e_min, e_max in ranked:
+                soc_k = soc[rows, k]
+                energy_in = p_in * time
+                # each battery follows the sign of the power left by the previous ones, as in BessFleet
+                pos = energy_in > 0
+                energy = np.where(pos, energy_in, -energy_in)
+                active = np.where(pos, soc_k < soc_max, soc_k >= soc_min)
+                avaliability = np.where(pos, cap * (soc_max - soc_k), cap * (soc_k - soc_min))
+                full = energy >= avaliability
+                x = np.where(full, avaliability, energy)
+                over = x > e_max
+                under = ~over & (x < e_min)
+                x = np.where(over, e_max, np.where(under, 0, x))
+
+                x = np.where(active, x, 0)
+                battery = np.where(pos, x, -x)
+                soc[rows, k] = (cap * soc_k + battery) / cap
+
+                stored = np.where(pos, battery, 0) / time
+                supply = np.where(pos, 0, -battery) / time
+                if charging:
+                    p_in = p_in - stored
+                else:
+                    p_in = p_in + supply
+                stored_tot += stored
+                supply_tot += supply
+
+            num = 0
+            for k in range(n_bess):
+                num = num + soc[:, k] * self.cap[:, k]
+
+            stored_tot_ev[:, i] = stored_tot
+            supply_tot_ev[:, i] = supply_tot
+            power_tot_ev[:, i] = stored_tot if charging else -supply_tot
+            soc_tot_ev[:, i] = num / den
+
+        return stored_tot_ev, supply_tot_ev, power_tot_ev, soc_tot_ev
@@ -0,0 +1,383 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import copy
+import numpy as np
+
+class BessFleet:
+    # quantities recorded for each battery and time step, same keys as Bess.en_perf_evolution
+    quantities = ['power_in', 'soc', 'stored', 'supply', 'power', 'surplus', 'deficit', 'current', 'case']
+    # quantities recorded at each recording level: 'none' and 'aggregates' keep only the totals of the fleet
+    recording_levels = {'none': [], 'aggregates': [], 'key': ['soc', 'power', 'case'], 'full': quantities}
+    # attributes that must be equal for batteries to be merged into a virtual unit
+    aggregation_keys = ['cap', 'v', 'i_max', 'i_min', 'soc_max', 'soc_min', 'soc_in']
+    # quantities split evenly among the batteries of a virtual unit, the others are the same for all of them
+    split_quantities = ['stored', 'supply', 'power', 'surplus', 'deficit', 'current']
+
+    def __init__(self, bess, recording='full'):
+        """
+        group of batteries dispatched together, parameters and state are kept in contiguous arrays (one entry per
+        battery, in the order of the input list)
+
+        :param bess: list of obj by Bess
+        :param recording: str--> series recorded for each battery (see recording_levels): 'full' all the quantities,
+            'key' soc, power and case, 'aggregates' or 'none' only the totals of the fleet
+        """
+        if recording not in self.recording_levels:
+            raise ValueError(f"Unrecognized recording level: {recording}")
+        self.bess = bess
+        self.recording = recording
+        self.cap = np.array([battery.cap for battery in bess], dtype=float)
+        self.soc_max = np.array([battery.soc_max for battery in bess], dtype=float)
+        self.soc_min = np.array([battery.soc_min for battery in bess], dtype=float)
+        self.v = np.array([battery.v for battery in bess], dtype=float)
+        self.i_max = np.array([battery.i_max for battery in bess], dtype=float)
+        self.i_min = np.array([battery.i_min for battery in bess], dtype=float)
+        self.soc = np.array([battery.soc_in for battery in bess], dtype=float)
+        self.en_perf_evolution = {}
+        self.skipped_steps = 0
+
+    def energy_limits(self, time):
+        """
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: energy_min, energy_max: array --> min. and max. energy exchanged by each battery in a time step (kWh)
+        """
+        energy_min = self.v * time * self.i_min / 1000
+        energy_max = self.v * time * self.i_max / 1000
+        return energy_min, energy_max
+
+    def energy_performance(self, power_in, time):
+        """
+        dispatches the net power among the batteries, step by step: when charging the batteries are served from the
+        lowest to the highest soc, when discharging from the highest to the lowest (ties keep the input order), each
+        battery receiving the power left by the previous ones. The operation of each battery is the one of
+        Bess.energy_performance.
+
+        :param power_in: array--> net power, production - demand (kW)
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: arrays in the dtype of power_in (float32 or float64), the operation and the soc are always computed
+            in float64:
+                stored_tot_ev (kW)
+                supply_tot_ev (kW)
+                power_tot_ev (kW)
+                soc_tot_ev
+        """
+        power_in = np.asarray(power_in)
+        dtype = np.result_type(np.float32, power_in.dtype)
+        power_in = power_in.astype(dtype, copy=False)
+        len_ref = len(power_in)
+        n_bess = len(self.bess)
+
+        # per battery series of the recording level, case (operating mode 0-14) as int8
+        recorded = self.recording_levels[self.recording]
+        self.en_perf_evolution = {key: np.zeros((n_bess, len_ref), dtype=np.int8 if key == 'case' else dtype)
+                                  for key in recorded}
+        record_full = self.recording == 'full'
+        record_key = 'soc' in recorded
+        out_power_in = self.en_perf_evolution.get('power_in')
+        out_soc = self.en_perf_evolution.get('soc')
+        out_stored = self.en_perf_evolution.get('stored')
+        out_supply = self.en_perf_evolution.get('supply')
+        out_power = self.en_perf_evolution.get('power')
+        out_surplus = self.en_perf_evolution.get('surplus')
+        out_deficit = self.en_perf_evolution.get('deficit')
+        out_current = self.en_perf_evolution.get('current')
+        out_case = self.en_perf_evolution.get('case')
+
+        stored_tot_ev = np.zeros(len_ref, dtype=dtype)
+        supply_tot_ev = np.zeros(len_ref, dtype=dtype)
+        power_tot_ev = np.zeros(len_ref, dtype=dtype)
+        # capacity weighted soc: numerator accumulated in float64, in the order of the input list
+        num_ev = np.zeros(len_ref)
+
+        # scalar loop on python floats, the soc array is updated at the end
+        energy_min, energy_max = self.energy_limits(time)
+        cap = self.cap.tolist()
+        soc_max = self.soc_max.tolist()
+        soc_min = self.soc_min.tolist()
+        v = self.v.tolist()
+        i_max = self.i_max.tolist()
+        energy_min = energy_min.tolist()
+        energy_max = energy_max.tolist()
+        soc_list = self.soc.tolist()
+
+        # idle runs: consecutive steps charging (discharging) with all the batteries full (empty) leave every soc
+        # unchanged when the soc update (cap*soc + 0)/cap returns the soc itself, they are filled at once with the
+        # values of the step by step operation (mode 7 when full, mode 9, 10 or 14 when empty)
+        energy_in_ev = power_in * time
+        positive = energy_in_ev > 0
+        switch = np.flatnonzero(positive[1:] != positive[:-1]) + 1
+        self.skipped_steps = 0
+
+        # dispatch order of each direction (ascending soc when charging, descending when discharging, ties in the
+        # order of the input list as with a stable sort), kept between steps and sorted again only when a soc crossed
+        # a neighbour's
+        batteries = range(n_bess)
+        orders = {True: sorted(batteries, key=soc_list.__getitem__),
+                  False: sorted(batteries, key=soc_list.__getitem__, reverse=True)}
+
+        power_list = power_in.tolist()
+        i = 0
+        while i < len_ref:
+            p_in = power_list[i]
+            if positive[i]:
+                idle = all(soc_list[k] >= soc_max[k] for k in range(n_bess))
+            else:
+                idle = all(soc_list[k] <= soc_min[k] for k in range(n_bess))
+            idle = idle and all(cap[k] * soc_list[k] / cap[k] == soc_list[k] for k in range(n_bess))
+            if idle:
+                end = switch[np.searchsorted(switch, i, side='right')] if len(switch) and switch[-1] > i else len_ref
+                span = slice(i, end)
+                num = 0
+                for k in range(n_bess):
+                    num += soc_list[k] * cap[k]
+                    if record_key:
+                        out_soc[k, span] = soc_list[k]
+                        if positive[i]:
+                            out_case[k, span] = 7
+                        else:
+                            out_case[k, span] = 14 if soc_list[k] < soc_min[k] else (9 if energy_min[k] > 0 else 10)
+                    if record_full:
+                        if positive[i]:
+                            out_power_in[k, span] = power_in[span]
+                            out_surplus[k, span] = energy_in_ev[span] / time
+                        else:
+                            out_power_in[k, span] = power_in[span] + 0.0
+                            out_deficit[k, span] = -energy_in_ev[span] / time
+                num_ev[span] = num
+                self.skipped_steps += end - i
+                i = end
+                continue
+
+            stored_tot = 0
+            supply_tot = 0
+            charging = p_in > 0
+            order = orders[charging]
+            if n_bess > 1 and not self.in_order(order, soc_list, descending=not charging):
+                order = orders[charging] = sorted(batteries, key=soc_list.__getitem__, reverse=not charging)
+
+            for k in order:
+                soc = soc_list[k]
+                # the branch of each battery follows the sign of the power left by the previous ones (it can differ
+                # from the step direction by rounding), as in Bess.energy_performance
+                energy_in = p_in * time
+                if energy_in > 0:
+                    if soc < soc_max[k]:
+                        avaliability = cap[k] * (soc_max[k] - soc)
+                        if energy_in >= avaliability:
+                            charge = avaliability
+                            mode = 0
+                        else:
+                            charge = energy_in
+                            mode = 3
+                        if charge > energy_max[k]:
+                            charge = energy_max[k]
+                            current = i_max[k]
+                            mode += 1
+                        elif charge < energy_min[k]:
+                            charge = 0
+                            current = 0
+                            mode += 2
+                        else:
+                            current = charge * 1000 / (time * v[k])
+                            mode += 3
+                        surplus = energy_in - charge
+                        battery = charge
+                    else:
+                        surplus = energy_in
+                        battery = 0
+                        current = 0
+                        mode = 7
+                    deficit = 0
+                    stored = battery
+                    supply = 0
+                else:
+                    energy_out = -energy_in
+                    if soc >= soc_min[k]:
+                        avaliability = cap[k] * (soc - soc_min[k])
+                        if energy_out >= avaliability:
+                            discharge = avaliability
+                            mode = 7
+                        else:
+                            discharge = energy_out
+                            mode = 10
+                        if discharge > energy_max[k]:
+                            discharge = energy_max[k]
+                            current = i_max[k]
+                            mode += 1
+                        elif discharge < energy_min[k]:
+                            discharge = 0
+                            current = 0
+                            mode += 2
+                        else:
+                            current = discharge * 1000 / (time * v[k])
+                            mode += 3
+                        deficit = energy_out - discharge
+                        battery = -discharge
+                        supply = -battery
+                    else:
+                        deficit = energy_out
+                        battery = 0
+                        supply = 0
+                        current = 0
+                        mode = 14
+                    surplus = 0
+                    stored = 0
+
+                soc = (cap[k] * soc + battery) / cap[k]
+                stored = stored / time
+                supply = supply / time
+                soc_list[k] = soc
+                if charging:
+                    p_in -= stored
+                else:
+                    p_in += supply
+                stored_tot += stored
+                supply_tot += supply
+
+                if record_key:
+                    out_soc[k, i] = soc
+                    out_power[k, i] = battery / time
+                    out_case[k, i] = mode
+                if record_full:
+                    out_power_in[k, i] = p_in
+                    out_stored[k, i] = stored
+                    out_supply[k, i] = supply
+                    out_surplus[k, i] = surplus / time
+                    out_deficit[k, i] = deficit / time
+                    out_current[k, i] = current
+
+            num = 0
+            for k in range(n_bess):
+                num += soc_list[k] * cap[k]
+            num_ev[i] = num
+            stored_tot_ev[i] = stored_tot
+            supply_tot_ev[i] = supply_tot
+            power_tot_ev[i] = stored_tot if charging else -supply_tot
+            i += 1
+        self.soc[:] = soc_list
+
+        den = 0
+        for k in range(n_bess):
+            den += cap[k]
+        soc_tot_ev = (num_ev / den).astype(dtype, copy=False)
+
+        return stored_tot_ev, supply_tot_ev, power_tot_ev, soc_tot_ev
+
+    @staticmethod
+    def in_order(order, soc, descending=False):
+        """
+        :param order: list of int --> indices of the batteries, in the dispatch order of the previous step
+        :param soc: list of float --> state of charge of each battery
+        :param descending: bool --> True when discharging
+        :return: bool --> True if order is still sorted by soc (ties in the order of the input list), i.e. no soc
+            crossed a neighbour's
+        """
+        a = order[0]
+        for b in order[1:]:
+            if soc[a] == soc[b]:
+                if a > b:
+                    return False
+            elif (soc[a] < soc[b]) if descending else (soc[a] > soc[b]):
+                return False
+            a = b
+        return True
+
+    def update_bess(self):
+        """
+        copies the results of the last simulation to the batteries: en_perf_evolution (rows of the fleet arrays) and
+        final state of charge (soc_in)
+        """
+        for k, battery in enumerate(self.bess):
+            battery.en_perf_evolution = {key: series[k] for key, series in self.en_perf_evolution.items()}
+            battery.soc_in = float(self.soc[k])
+
+    @classmethod
+    def aggregate(cls, bess):
+        """
+        merges identical batteries (same aggregation_keys) into virtual units with capacity and current limits
+        multiplied by the number of batteries (same voltage and soc limits).
+
+        A virtual unit exchanges the same energy as its batteries dispatched one by one when i_min is 0 and i_max
+        is never binding for a single battery (|net power| * time <= energy_max of one battery in every step): each
+        battery then takes the minimum between the power left and its availability, so the total is the minimum
+        between the net power and the total availability, whatever the order. Within a virtual unit the results
+        are split evenly, while the batteries dispatched one by one are filled one after the other.
+
+        :param bess: list of obj by Bess
+        :return:
+                virtual: list of obj by Bess --> one unit per group (the battery itself for groups of one)
+                groups: list of list of obj by Bess --> batteries of each virtual unit
+                report: dict --> {'groups': ids of each group, 'mismatches': for each group after the first, the
+                    attributes that differ from the first group, e.g. {('b3',): {'soc_in': (0.3, 0.5)}}}
+        """
+        grouped = {}
+        for battery in bess:
+            key = tuple(getattr(battery, attr) for attr in cls.aggregation_keys)
+            grouped.setdefault(key, []).append(battery)
+        groups = list(grouped.values())
+
+        virtual = []
+        for members in groups:
+            if len(members) == 1:
+                virtual.append(members[0])
+                continue
+            n = len(members)
+            unit = copy.copy(members[0])
+            unit.id = '+'.join(str(battery.id) for battery in members)
+            unit.cap = members[0].cap * n
+            unit.opex = members[0].opex * n
+            unit.i_max = members[0].i_max * n
+            unit.i_min = members[0].i_min * n
+            unit.en_perf_evolution = {}
+            virtual.append(unit)
+
+        reference = groups[0][0] if groups else None
+        mismatches = {}
+        for members in groups[1:]:
+            mismatches[tuple(battery.id for battery in members)] = {
+                attr: (getattr(members[0], attr), getattr(reference, attr)) for attr in cls.aggregation_keys
+                if getattr(members[0], attr) != getattr(reference, attr)}
+        report = {'groups': [[battery.id for battery in members] for members in groups], 'mismatches': mismatches}
+        return virtual, groups, report
+
+    @staticmethod
+    def aggregation_violations(groups, power_in, time):
+        """
+        checks the equivalence condition of aggregate for the groups of more than one battery
+
+        :param groups: list of list of obj by Bess --> see aggregate
+        :param power_in: array--> net power, production - demand (kW)
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: list of str --> one message per violated condition (empty when the aggregation is equivalent)
+        """
+        violations = []
+        max_energy = np.max(np.abs(power_in)) * time if len(power_in) else 0
+        for members in groups:
+            if len(members) < 2:
+                continue
+            battery = members[0]
+            ids = '+'.join(str(member.id) for member in members)
+            if battery.i_min != 0:
+                violations.append(f"{ids}: i_min is not 0")
+            energy_max = battery.v * time * battery.i_max / 1000
+            if max_energy > energy_max:
+                violations.append(f"{ids}: i_max can be binding (max. energy per step {max_energy} > {energy_max} kWh)")
+        return violations
+
+    def split(self, groups):
+        """
+        copies the results of the virtual units of the last simulation (see aggregate) to their batteries:
+        quantities in split_quantities are divided evenly, the others are the same for all the batteries
+
+        :param groups: list of list of obj by Bess --> batteries of each unit of the fleet
+        """
+        for k, members in enumerate(groups):
+            n = len(members)
+            for battery in members:
+                battery.en_perf_evolution = {}
+                for key, series in self.en_perf_evolution.items():
+                    value = series[k]
+                    battery.en_perf_evolution[key] = value / n if key in self.split_quantities and n > 1 else value
+                battery.soc_in = float(self.soc[k])
@@ -6,18 +6,20 @@ Created on June 7 08:00:00 2025
 
 
 class Consumer:
-    def __init__(self, id, dem):
+    def __init__(self, id, dem=None, matrix=None):
         """
 
         :param id: str --> identification code  e.g.: 'consumer1'
         :param dem: dict --> load curve  e.g  {'electricity': [0,0,...],'heat': [0,0,...]}
+        :param matrix: obj by DemandMatrix --> shared load curves of all the consumers: when given, the consumer holds
+            only its row index for each carrier (rows) and dem contains views on the matrix rows
         """
 
         self.id = id
+        self.matrix = matrix
+        self.rows = {}
+        if matrix is not None:
+            self.rows = {carrier: rows[id] for carrier, rows in matrix.rows.items() if id in rows}
+            dem = {carrier: matrix.data[carrier][row] for carrier, row in self.rows.items()}
         self.dem = dem
         self.en_perf_evolution=dem
-
-
-
-
-
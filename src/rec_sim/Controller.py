@@ -5,19 +5,31 @@ Created on June 5 08:00:00 2025
 """
 
 import numpy as np
+from src.rec_sim.BessFleet import BessFleet
+from src.rec_sim.BessBatch import BessBatch
 
 class Controller:
-    def __init__(self, bess):
+    def __init__(self, bess, aggregate=False, recording='full'):
         """
         :param bess--> list of obj by Bess
+        :param aggregate: bool--> identical batteries are simulated as a single virtual unit (see BessFleet.aggregate)
+        :param recording: str--> series recorded for each battery, see BessFleet.recording_levels
         """
         self.bess = bess
+        self.aggregate = aggregate
+        self.recording = recording
+        self.aggregation = {}
 
     def energy_performance(self, production, demand, time):
         """
              :param production: DataSeries or Array-->  (kW)
              :param demand: DataSeries or Array--> (kW)
              :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+             batteries are dispatched by BessFleet: charged from the lowest soc, discharged from the highest soc. With
+             aggregate, the report of the aggregation (groups, mismatches and violations of the equivalence
+             condition) is stored in self.aggregation. The outputs are float32 when production and demand are both
+             float32, the dispatch itself is computed in float64.
+
              :return:
                     stored_tot_ev (kW)
                     supply_tot_ev (kW)
@@ -29,83 +41,52 @@ class Controller:
              """
 
 
-        stored_tot_ev = np.zeros(len(production))
-        supply_tot_ev = np.zeros(len(production))
-        power_tot_ev = np.zeros(len(production))
-        surplus_tot_ev = np.zeros(len(production))
-        deficit_tot_ev = np.zeros(len(production))
-        soc_tot_ev = np.zeros(len(production))
-        bess = self.bess
-        len_ref = len(production)
-        for battery in bess:
-            battery.en_perf_evolution['power_in'] = np.zeros(len_ref)
-            battery.en_perf_evolution['soc'] = np.zeros(len_ref)
-            battery.en_perf_evolution['stored'] = np.zeros(len_ref)
-            battery.en_perf_evolution['supply'] = np.zeros(len_ref)
-            battery.en_perf_evolution['power'] = np.zeros(len_ref)
-            battery.en_perf_evolution['surplus'] = np.zeros(len_ref)
-            battery.en_perf_evolution['deficit'] = np.zeros(len_ref)
-            battery.en_perf_evolution['current'] = np.zeros(len_ref)
-            battery.en_perf_evolution['case'] = np.zeros(len_ref)
-
-        for i in range(len(production)):
-            power_in = production[i] - demand[i]
-            stored_tot = 0
-            supply_tot = 0
-            power_tot = 0
-            if power_in > 0:
-                bess_sorted = sorted(bess, key=lambda bess: bess.soc_in)
-                for battery in bess_sorted:
-                    power_in_battery=power_in
-                    power_in_battery1, soc, stored, supply, power, surplus, deficit, current, case = battery.energy_performance(
-                        power_in_battery, time)
-                    battery.soc_in = soc
-                    power_in -= stored
-                    stored_tot += stored
-                    supply_tot += supply
-                    power_tot = stored_tot
-                    memories = {'power_in': power_in, 'soc': soc, 'stored': stored, 'supply': supply,
-                                'power': power,
-                                'surplus': surplus,
-                                'deficit': deficit, 'current': current, 'case': case}
-                    for key, value in memories.items():
-                        battery.en_perf_evolution[key][i] = value
-            else:
-                bess_sorted = sorted(bess, key=lambda bess: bess.soc_in, reverse=True)
-                for battery in bess_sorted:
-                    power_in_battery1, soc, stored, supply, power, surplus, deficit, current, case = battery.energy_performance(
-                        power_in, time)
-                    battery.soc_in = soc
-
-                    power_in += supply
-                    stored_tot += stored
-                    supply_tot += supply
-                    power_tot = -supply_tot
-                    memories = {'power_in': power_in, 'soc': soc, 'stored': stored, 'supply': supply,
-                                'power': power,
-                                'surplus': surplus,
-                                'deficit': deficit, 'current': current, 'case': case}
-                    for key, value in memories.items():
-                        battery.en_perf_evolution[key][i] = value
-
-
-            num=0
-            den=0
-            for battery in bess:
-                num+=battery.en_perf_evolution['soc'][i]*battery.cap
-                den+=battery.cap
-
-            soc_tot=num/den
-
-            stored_tot_ev[i] = stored_tot
-            supply_tot_ev[i] = supply_tot
-            surplus_tot_ev[i] = production[i] - min(production[i], demand[i]) - stored_tot
-            deficit_tot_ev[i] = demand[i] - min(production[i], demand[i]) - supply_tot
-            power_tot_ev[i] = power_tot
-            soc_tot_ev[i]=soc_tot
+        dtype = np.result_type(np.float32, np.asarray(production).dtype, np.asarray(demand).dtype)
+        production = np.asarray(production, dtype=dtype)
+        demand = np.asarray(demand, dtype=dtype)
 
+        if self.aggregate:
+            virtual, groups, self.aggregation = BessFleet.aggregate(self.bess)
+            self.aggregation['violations'] = BessFleet.aggregation_violations(
+                groups=groups, power_in=production - demand, time=time)
+            fleet = BessFleet(virtual, recording=self.recording)
+            stored_tot_ev, supply_tot_ev, power_tot_ev, soc_tot_ev = fleet.energy_performance(
+                power_in=production - demand, time=time)
+            fleet.split(groups)
+        else:
+            fleet = BessFleet(self.bess, recording=self.recording)
+            stored_tot_ev, supply_tot_ev, power_tot_ev, soc_tot_ev = fleet.energy_performance(
+                power_in=production - demand, time=time)
+            fleet.update_bess()
 
+        surplus_tot_ev = production - np.minimum(production, demand) - stored_tot_ev
+        deficit_tot_ev = demand - np.minimum(production, demand) - supply_tot_ev
 
         return stored_tot_ev, supply_tot_ev, power_tot_ev, surplus_tot_ev, deficit_tot_ev,soc_tot_ev
 
+    @staticmethod
+    def energy_performance_batch(production, demand, time, bess_scenarios):
+        """
+             same as energy_performance for several battery configurations at once (e.g. battery sizing), all
+             dispatched against the same production and demand in a single time loop by BessBatch. The batteries are
+             not modified (each call starts from their soc_in).
+
+             :param production: DataSeries or Array-->  (kW)
+             :param demand: DataSeries or Array--> (kW)
+             :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+             :param bess_scenarios: list of list of obj by Bess--> one list of batteries per scenario, all with the
+                same number of batteries
+             :return: same outputs as energy_performance, as arrays (scenario x time step)
+             """
+        dtype = np.result_type(np.float32, np.asarray(production).dtype, np.asarray(demand).dtype)
+        production = np.asarray(production, dtype=dtype)
+        demand = np.asarray(demand, dtype=dtype)
+
+        batch = BessBatch(bess_scenarios)
+        stored_tot_ev, supply_tot_ev, power_tot_ev, soc_tot_ev = batch.energy_performance(
+            power_in=production - demand, time=time)
+
+        surplus_tot_ev = production - np.minimum(production, demand) - stored_tot_ev
+        deficit_tot_ev = demand - np.minimum(production, demand) - supply_tot_ev
 
+        return stored_tot_ev, supply_tot_ev, power_tot_ev, surplus_tot_ev, deficit_tot_ev, soc_tot_ev
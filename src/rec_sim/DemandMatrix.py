@@ -0,0 +1,197 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from pathlib import Path
+import hashlib
+import json
+import os
+
+
+class DemandMatrix:
+    def __init__(self, data, ids, dtype=float):
+        """
+        load curves of all the consumers stored in one 2-D array per carrier (users x time), consumers refer to their
+        rows (see Consumer)
+
+        :param data: dict--> {carrier: array (users x time)}  e.g. {'electricity': [[0,0,...],[0,0,...]]}
+        :param ids: dict--> {carrier: list of consumer ids, one per row}  e.g. {'electricity': ['0','1']}
+        :param dtype: numpy dtype--> dtype of the load curves, e.g. np.float32 to halve the memory
+        """
+        self.data = {carrier: np.ascontiguousarray(matrix, dtype=dtype) for carrier, matrix in data.items()}
+        self.ids = ids
+        self.rows = {carrier: {user_id: row for row, user_id in enumerate(user_ids)} for carrier, user_ids in ids.items()}
+
+    @classmethod
+    def from_dataframe(cls, df, users, dtype=float):
+        """
+        :param df: DataFrame--> load curves, one column per curve
+        :param users: dict--> {consumer id: {carrier: column}}  e.g. {'0': {'electricity': 'user0'}}
+        :param dtype: numpy dtype--> dtype of the load curves
+        :return: obj by DemandMatrix
+        """
+        ids = {}
+        columns = {}
+        for user_id, carriers in users.items():
+            for carrier, column in carriers.items():
+                ids.setdefault(carrier, []).append(user_id)
+                columns.setdefault(carrier, []).append(column)
+        data = {carrier: df[columns[carrier]].to_numpy(dtype=dtype).T for carrier in columns}
+        return cls(data=data, ids=ids, dtype=dtype)
+
+    @classmethod
+    def from_csv(cls, file_path, users, sep=';', cache_dir=None, dtype=float):
+        """
+        reads only the columns referenced by the users, parsed directly as floats. With a cache_dir the matrices are
+        also written there as binary .npy files (one per carrier) and later runs map them from disk instead of parsing
+        the csv. The cached files are rebuilt when the csv changes: a different size or modification time invalidates
+        them unless the sha1 of the csv content is unchanged. The csv is always parsed and cached in float64 (one cache for
+        every dtype), the matrices are converted to the requested dtype when loaded. If the cache cannot be read or written (OSError, e.g. a read-only
+        directory) the csv is parsed without cache.
+
+        :param file_path: str or Path--> demand curve file, one column per curve
+        :param users: dict--> {consumer id: {carrier: column}}  e.g. {'0': {'electricity': 'user0'}}
+        :param sep: str--> column separator of the csv
+        :param cache_dir: str or Path--> directory of the cached matrices (created if missing), None for no cache
+        :param dtype: numpy dtype--> dtype of the load curves
+        :return: obj by DemandMatrix
+        """
+        file_path = Path(file_path)
+        ids = {}
+        columns = {}
+        for user_id, carriers in users.items():
+            for carrier, column in carriers.items():
+                ids.setdefault(carrier, []).append(user_id)
+                columns.setdefault(carrier, []).append(column)
+
+        if cache_dir is not None:
+            cache_dir = Path(cache_dir)
+            key = hashlib.sha1(json.dumps([str(file_path.resolve()), sep, ids, columns],
+                                          sort_keys=True).encode()).hexdigest()[:16]
+            meta_path = cache_dir / f"{file_path.name}.{key}.json"
+            data_path = {carrier: cache_dir / f"{file_path.name}.{key}.{carrier}.npy" for carrier in columns}
+            try:
+                data = cls.load_sidecar(file_path, meta_path, data_path)
+            except OSError:
+                data = None
+                cache_dir = None
+            if data is not None:
+                return cls(data=data, ids=ids, dtype=dtype)
+
+        usecols = list(dict.fromkeys(column for carrier in columns for column in columns[carrier]))
+        df = pd.read_csv(file_path, sep=sep, usecols=usecols, dtype={column: np.float64 for column in usecols})
+        if cache_dir is None:
+            return cls.from_dataframe(df=df, users=users, dtype=dtype)
+
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            stat = file_path.stat()
+            for carrier in columns:
+                tmp = data_path[carrier].with_name(data_path[carrier].name[:-len('.npy')] + '.tmp.npy')
+                np.save(tmp, np.ascontiguousarray(df[columns[carrier]].to_numpy(dtype=float).T))
+                os.replace(tmp, data_path[carrier])
+            with open(meta_path, "w") as file:
+                json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': cls.file_hash(file_path),
+                           'columns': columns}, file)
+            return cls(data=cls.load_sidecar(file_path, meta_path, data_path), ids=ids, dtype=dtype)
+        except OSError:
+            return cls.from_dataframe(df=df, users=users, dtype=dtype)
+
+    @classmethod
+    def load_sidecar(cls, file_path, meta_path, data_path):
+        """
+        :param file_path: Path--> demand curve file
+        :param meta_path: Path--> metadata of the cached matrices (size, mtime_ns and sha1 of the csv)
+        :param data_path: dict--> {carrier: Path of the cached .npy matrix}
+        :return: dict--> {carrier: read-only memory-mapped array (users x time)}, None if the cached matrices are
+            missing or stale
+        """
+        if not meta_path.exists() or not all(path.exists() for path in data_path.values()):
+            return None
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        stat = file_path.stat()
+        if stat.st_size != meta['size']:
+            return None
+        if stat.st_mtime_ns != meta['mtime_ns']:
+            # touched but maybe not modified: the content hash decides
+            if cls.file_hash(file_path) != meta['sha1']:
+                return None
+            meta['mtime_ns'] = stat.st_mtime_ns
+            with open(meta_path, "w") as file:
+                json.dump(meta, file)
+        return {carrier: np.load(path, mmap_mode='r') for carrier, path in data_path.items()}
+
+    @staticmethod
+    def file_hash(file_path):
+        """
+        :param file_path: Path
+        :return: str--> sha1 of the file content
+        """
+        digest = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def row(self, carrier, user_id):
+        """
+        :param carrier: str--> e.g. 'electricity'
+        :param user_id: str--> consumer id
+        :return: array--> load curve of the consumer (view on the matrix)
+        """
+        return self.data[carrier][self.rows[carrier][user_id]]
+
+    def sum_rows(self, carrier, rows):
+        """
+        sum of the load curves of a group of consumers, as the product of a sparse membership row (1 for the rows of
+        the group) by the matrix: the rows are added in ascending order, in a single pass without temporary copies
+        (a row listed twice is counted twice)
+
+        :param carrier: str--> e.g. 'electricity'
+        :param rows: list of int--> rows of the consumers of the group
+        :return: array--> total load curve of the group
+        """
+        matrix = self.data[carrier]
+        rows = np.asarray(rows, dtype=int)
+        membership = sparse.csr_matrix((np.ones(len(rows), dtype=matrix.dtype), (np.zeros(len(rows), dtype=int), rows)),
+                                       shape=(1, matrix.shape[0]))
+        return np.asarray(membership @ matrix).ravel()
+
+    @staticmethod
+    def sum_demand(consumers, carrier):
+        """
+        total load curve of a list of consumers: a single matrix reduction when they all refer to the same
+        DemandMatrix, their load curves accumulated in place otherwise
+
+        :param consumers: list of obj by Consumer--> consumers with a load curve for the carrier
+        :param carrier: str--> e.g. 'electricity'
+        :return: array--> total load curve, None if the list is empty
+        """
+        if not consumers:
+            return None
+        matrix = consumers[0].matrix
+        if matrix is not None and all(consumer.matrix is matrix for consumer in consumers):
+            return matrix.sum_rows(carrier, [consumer.rows[carrier] for consumer in consumers])
+        return DemandMatrix.sum_series([consumer.en_perf_evolution[carrier] for consumer in consumers])
+
+    @staticmethod
+    def sum_series(series):
+        """
+        element-wise sum of a list of series, accumulated in place into a single output array (the series are added
+        in list order, as with repeated +=, without index alignment nor temporary arrays)
+
+        :param series: list of DataSeries or array--> series of equal length
+        :return: array--> sum of the series, float32 if all the series are float32 and float64 otherwise, None if the
+            list is empty
+        """
+        if not len(series):
+            return None
+        dtype = np.result_type(np.float32, *(np.asarray(s).dtype for s in series))
+        total = np.array(series[0], dtype=dtype)
+        for s in series[1:]:
+            np.add(total, np.asarray(s, dtype=dtype), out=total)
+        return total
@@ -6,18 +6,29 @@ Created on June 7 08:00:00 2025
 
 
 import numpy as np
-import numpy_financial as npf
 
 class Economics:
     def __init__(self, components, annual_en_flows_and_prices):
         """
         :param components: list of objects by System or Bess
         :param annual_en_flows_and_prices: dict : e.g. annual_en_flows_and_prices={'electricity':{'sold':100,'self_cons':200,'purchased':10,'price_sold':2,'price_buy':3,'decay':0.02}}
+            'sold', 'self_cons' and 'purchased' can also be lists with one value per simulated weather year, e.g. 'sold':[100,95,104]
         """
 
         self.components = components
         self.annual_en_flows_and_prices = annual_en_flows_and_prices
 
+    @staticmethod
+    def annual_value(value, year):
+        """
+        :param value: float or list of float (one per simulated weather year)
+        :param year: int : year of the investment horizon, starting from 1
+        :return: float : value of the given year, weather years are repeated cyclically over the time horizon
+        """
+        if np.ndim(value) == 0:
+            return value
+        return value[(year - 1) % len(value)]
+
     def compute_cashflow(self,time_horizon,tax_rate ,int_rate, other_capex_perc=[0]):
         """
 
@@ -27,121 +38,315 @@ class Economics:
         :param other_capex_perc: list of other capex as percentage of total capex e.g [0.2,0.5]
         :return: ec_perf: dict : e.g. ec_perf={'NPV':value,'pbp':value,'capex':value,'rev_from_sale':r1,'rev_savings':r2,'rev_incentives':r3,'rev_others':r4,'cost_resources':c1,'cost_opex':c2,'cost_taxes':c3,'cost_taxes_on_sale':c4,'cost_others':c5}
         """
+        # single scenario of compute_cashflow_batch
+        batch = self.compute_cashflow_batch(time_horizon=time_horizon, tax_rate=tax_rate, int_rate=int_rate,
+                                            other_capex_perc=other_capex_perc, flows_and_prices=self.flows_batch())
 
-        outflow = np.zeros(time_horizon + 1)
-        inflow = np.zeros(time_horizon + 1)
-        cashflow = np.zeros(time_horizon + 1)
-        cashflow_cum = np.zeros(time_horizon + 1)
-        r1 = np.zeros(time_horizon + 1)
-        r2 = np.zeros(time_horizon + 1)
-        r3 = np.zeros(time_horizon + 1)
-        r4 = np.zeros(time_horizon + 1)
-        r5 = np.zeros(time_horizon + 1)
-        c1 = np.zeros(time_horizon + 1)
-        c2 = np.zeros(time_horizon + 1)
-        c3 = np.zeros(time_horizon + 1)
-        c4 = np.zeros(time_horizon + 1)
-        c5 = np.zeros(time_horizon + 1)
-        outflow0 = 0
-        opex_cost = 0
-        tax = 0
+        ec_perf={}
+        ec_perf['NPV'] = batch['NPV'][0]
+        ec_perf['pbp'] = batch['pbp'][0]
+        ec_perf['capex'] = batch['capex'][0]
+        for key in ['rev_from_sale', 'rev_savings', 'rev_incentives', 'rev_others', 'cost_resources', 'cost_opex',
+                    'cost_taxes', 'cost_taxes_on_sale', 'cost_others']:
+            ec_perf[key] = batch[key][0]
+
+        return ec_perf
+
+    def activity_masks(self, time_horizon):
+        """
+        years in which the incentives, other revenues and other costs of each component are active
+
+        :param time_horizon: int : investment time horizon (year)
+        :return: inc, rev, cost: list of (value, mask) : value per active year (€/year) and boolean array over years
+            1..time_horizon, in the order of the components (other costs are listed with the keys of other_rev)
+        """
+        years = np.arange(1, time_horizon + 1)
+        inc = []
+        rev = []
+        cost = []
         for component in self.components:
-            outflow0+=component.cap_cost_unit*component.cap
-            opex_cost+= component.opex_cost * component.opex
-            tax+=component.tax_year
+            start, end = component.inc_start_end
+            inc.append((component.inc_year, (start <= years) & (years <= end)))
+            for key in component.other_rev:
+                start, end = component.other_rev[key]['dur']
+                rev.append((component.other_rev[key]['unit'] * component.other_rev[key]['rev_unit'],
+                            (start <= years) & (years <= end)))
+                start, end = component.other_cost[key]['dur']
+                cost.append((component.other_cost[key]['unit'] * component.other_cost[key]['cost_unit'],
+                             (start <= years) & (years <= end)))
+        return inc, rev, cost
+
+    def compute_cashflow_batch(self, time_horizon, tax_rate, int_rate, other_capex_perc=[0], flows_and_prices=None,
+                               capex_factor=1.0, incentive_factor=1.0, incentive_duration=None, irr=True):
+        """
+        cash flows of N scenarios at once, with the same components. Every scenario parameter is a scalar (same for
+        all the scenarios) or an array with one value per scenario, the scenarios are the broadcast of all the
+        parameters. Scenario by scenario the results are the same of compute_cashflow.
+
+        :param time_horizon: int : investment time horizon (year)
+        :param tax_rate: float or array (N): tax on revenues from sale e.g 0.2
+        :param int_rate: float or array (N): interest rate for calculating NPV e.g 0.03
+        :param other_capex_perc: list of other capex as percentage of total capex e.g [0.2,0.5]
+        :param flows_and_prices: dict : as annual_en_flows_and_prices (default), with arrays (N) for one value per
+            scenario; 'sold', 'self_cons' and 'purchased' can also be arrays (N x weather years) or (1 x weather years),
+            repeated cyclically over the time horizon
+        :param capex_factor: float or array (N): multiplier of the investment cost
+        :param incentive_factor: float or array (N): multiplier of the incentives (inc_year) of the components
+        :param incentive_duration: int or array (N): years of incentives of each component from the start of its
+            inc_start_end, None for the end of inc_start_end
+        :param irr: bool : computes the IRR (nan otherwise)
+        :return: dict : 'NPV', 'pbp', 'IRR', 'capex' arrays (N) and arrays (N x time_horizon+1) for 'cashflow',
+            'cashflow_cum' and the breakdown of compute_cashflow ('rev_from_sale', ..., 'cost_others'), year 0 included
+        """
+        if flows_and_prices is None:
+            flows_and_prices = self.annual_en_flows_and_prices
+        years = np.arange(1, time_horizon + 1)
+
+        def per_scenario(value):
+            # (N,) or scalar --> column (N x 1) or (1 x 1)
+            return np.asarray(value, dtype=float).reshape(-1, 1)
 
+        def per_year(value):
+            # (N,) --> (N x 1), (N x weather years) --> (N x time_horizon) repeating the weather years
+            value = np.asarray(value, dtype=float)
+            if value.ndim < 2:
+                return value.reshape(-1, 1)
+            return value[:, (years - 1) % value.shape[1]]
 
+        tax_rate = per_scenario(tax_rate)
+        int_rate = per_scenario(int_rate)
+        capex_factor = per_scenario(capex_factor)
+        incentive_factor = per_scenario(incentive_factor)
+
+        outflow0 = 0
+        for component in self.components:
+            outflow0 += component.cap_cost_unit * component.cap
         total_percentage = sum(other_capex_perc)
-        outflow0 = outflow0 / (1 - total_percentage)
-
-
-        investment_cost = outflow0
-        opex_cost = 0
-        tax = 0
-
-        outflow[0] = investment_cost
-        inflow[0] = 0
-        cashflow[0] = inflow[0] - outflow[0]
-
-        r1[0] = 0
-        r2[0] = 0
-        r3[0] = 0
-        r5[0] = 0
-        c1[0] = 0
-        c2[0] = 0
-        c3[0] = 0
-        c4[0] = 0
-        c5[0] = 0
-
-
-        for year in range(1, time_horizon + 1):
-            r1_i = 0
-            r2_i = 0
-            r3_i = 0
-            r4_i = 0
-            c1_i = 0
-            c2_i = opex_cost
-            c3_i = tax
-            c5_i = 0
-            for key in self.annual_en_flows_and_prices:
-                r1_i += self.annual_en_flows_and_prices[key]['sold'] * self.annual_en_flows_and_prices[key]['price_sold'] * (
-                        1 - self.annual_en_flows_and_prices[key]['decay']) ** (year - 1)
-                r2_i += self.annual_en_flows_and_prices[key]['self_cons'] * self.annual_en_flows_and_prices[key]['price_buy'] * (
-                        1 - self.annual_en_flows_and_prices[key]['decay']) ** (year - 1)
-                c1_i+= self.annual_en_flows_and_prices[key]['purchased'] * self.annual_en_flows_and_prices[key]['price_buy']
-
-            c4_i = r1_i * tax_rate
+        outflow0 = outflow0 / (1 - total_percentage) * capex_factor
+
+        # energy flows, summed over the carriers in the order of the dict
+        r1 = 0
+        r2 = 0
+        c1 = 0
+        for key in flows_and_prices:
+            values = flows_and_prices[key]
+            # float_power: same rounding as the scalar (1 - decay) ** (year - 1)
+            decay = np.float_power(1 - per_scenario(values['decay']), years - 1)
+            r1 = r1 + per_year(values['sold']) * per_scenario(values['price_sold']) * decay
+            r2 = r2 + per_year(values['self_cons']) * per_scenario(values['price_buy']) * decay
+            c1 = c1 + per_year(values['purchased']) * per_scenario(values['price_buy'])
 
+        # incentives, other revenues and costs from the activity masks of the components
+        inc, rev, cost = self.activity_masks(time_horizon)
+        r3 = np.zeros(time_horizon)
+        r4 = np.zeros(time_horizon)
+        c5 = np.zeros(time_horizon)
+        if incentive_duration is None:
+            for value, mask in inc:
+                r3 = r3 + np.where(mask, value, 0)
+        else:
+            duration = per_scenario(incentive_duration)
             for component in self.components:
-                start,end=component.inc_start_end
-                is_in_range = start <= year <= end
-                if is_in_range:
-                    r3_i += component.inc_year
-                for key in component.other_rev:
-                    start,end=component.other_rev[key]['dur']
-                    is_in_range = start <= year <= end
-                    if is_in_range:
-                        r4_i += component.other_rev[key]['unit']*component.other_rev[key]['rev_unit']
-                    start, end = component.other_cost[key]['dur']
-                    is_in_range = start <= year <= end
-                    if is_in_range:
-                        c5_i += component.other_cost[key]['unit'] * component.other_cost[key]['cost_unit']
-
-
-
-            r1[year] = r1_i
-            r2[year] = r2_i
-            r3[year] = r3_i
-            r4[year] = r4_i
-            c1[year] = c1_i
-            c2[year] = c2_i
-            c3[year] = c3_i
-            c4[year] = c4_i
-            c5[year] = c5_i
-
-
-            outflow[year] = c1_i + c2_i + c3_i + c4_i+c5_i
-            inflow[year] = r1_i + r2_i + r3_i + r4_i
-            cashflow[year] = inflow[year] - outflow[year]
-            cashflow_cum[year] = cashflow_cum[year - 1] + cashflow[year]
-
-        NPV = npf.npv(int_rate, cashflow)
-        pbp = outflow0 / np.mean(cashflow[1:])
+                start = component.inc_start_end[0]
+                r3 = r3 + np.where((start <= years) & (years <= start + duration - 1), component.inc_year, 0)
+        for value, mask in rev:
+            r4 = r4 + np.where(mask, value, 0)
+        for value, mask in cost:
+            c5 = c5 + np.where(mask, value, 0)
+        r3 = r3 * incentive_factor
 
-        ec_perf={}
-        ec_perf['NPV'] = NPV
-        ec_perf['pbp'] = pbp
-        ec_perf['capex']=outflow0
-        ec_perf['rev_from_sale'] = r1
-        ec_perf['rev_savings'] = r2
-        ec_perf['rev_incentives'] = r3
-        ec_perf['rev_others'] = r4
-        ec_perf['cost_resources'] = c1
-        ec_perf['cost_opex'] = c2
-        ec_perf['cost_taxes'] = c3
-        ec_perf['cost_taxes_on_sale'] = c4
-        ec_perf['cost_others'] = c5
+        # opex and taxes on the systems are not accounted (null, as in compute_cashflow)
+        c2 = np.zeros(time_horizon)
+        c3 = np.zeros(time_horizon)
+        c4 = r1 * tax_rate
+
+        n = np.broadcast_shapes(*(np.shape(x) for x in (outflow0, int_rate, r1, r2, r3, c1, c4)))[0]
+        breakdown = {}
+        for name, x in [('rev_from_sale', r1), ('rev_savings', r2), ('rev_incentives', r3), ('rev_others', r4),
+                        ('cost_resources', c1), ('cost_opex', c2), ('cost_taxes', c3), ('cost_taxes_on_sale', c4),
+                        ('cost_others', c5)]:
+            breakdown[name] = np.zeros((n, time_horizon + 1))
+            breakdown[name][:, 1:] = x
+
+        outflow = (breakdown['cost_resources'] + breakdown['cost_opex'] + breakdown['cost_taxes']
+                   + breakdown['cost_taxes_on_sale'] + breakdown['cost_others'])
+        inflow = (breakdown['rev_from_sale'] + breakdown['rev_savings'] + breakdown['rev_incentives']
+                  + breakdown['rev_others'])
+        capex = np.broadcast_to(outflow0, (n, 1))[:, 0].copy()
+        outflow[:, 0] = capex
+        cashflow = inflow - outflow
+        cashflow_cum = np.zeros((n, time_horizon + 1))
+        cashflow_cum[:, 1:] = np.cumsum(cashflow[:, 1:], axis=1)
+
+        discount = (1 + np.broadcast_to(int_rate, (n, 1))) ** np.arange(0, time_horizon + 1)
+        NPV = (cashflow / discount).sum(axis=1)
+        pbp = capex / np.mean(cashflow[:, 1:], axis=1)
 
+        ec_perf = {'NPV': NPV, 'pbp': pbp, 'IRR': self.irr(cashflow) if irr else np.full(n, np.nan), 'capex': capex,
+                   'cashflow': cashflow,
+                   'cashflow_cum': cashflow_cum}
+        ec_perf.update(breakdown)
         return ec_perf
 
+    def yearly(self, value, time_horizon):
+        """
+        :param value: float or list of float (one per simulated weather year)
+        :param time_horizon: int : investment time horizon (year)
+        :return: array (time_horizon) : value of each year 1..time_horizon (see annual_value)
+        """
+        value = np.ravel(value) if np.ndim(value) else value
+        return np.array([self.annual_value(value, year) for year in range(1, time_horizon + 1)], dtype=float)
+
+    def npv_sensitivity(self, time_horizon, tax_rate, int_rate, other_capex_perc=[0], components=True):
+        """
+        exact partial derivatives of the NPV of compute_cashflow, from the yearly flows and discount factors (no
+        re-simulation). The NPV is linear in the prices, flows, unit investment costs and incentives, so the
+        derivatives hold for any change of a single one of them, e.g. a price +10% changes the NPV by
+        0.1 * price * derivative.
+
+        :param time_horizon: int : investment time horizon (year)
+        :param tax_rate: float: tax on revenues from sale e.g 0.2
+        :param int_rate: float: interest rate for calculating NPV e.g 0.03
+        :param other_capex_perc: list of other capex as percentage of total capex e.g [0.2,0.5]
+        :param components: bool : computes the derivatives of each component ('cap_cost', 'inc_year'), which require
+            unique component ids
+        :return: sensitivity: dict : 'NPV' and the derivatives of the NPV (€ per unit of the input):
+            'price_sold', 'price_buy', 'decay', 'sold', 'self_cons', 'purchased': {carrier: value}, the flows as a
+            change of the annual energy of every year
+            'cap_cost', 'inc_year': {component id: value}, unit investment cost and yearly incentive of the components
+            (only with components=True)
+            'other_capex_perc': list, one value per item
+            'capex_factor', 'incentive_factor': value, multipliers of the investment cost and of all the incentives
+            'tax_rate', 'int_rate': value
+        """
+        if components:
+            ids = [component.id for component in self.components]
+            duplicates = sorted({component_id for component_id in ids if ids.count(component_id) > 1})
+            if duplicates:
+                raise ValueError(f"Duplicate component ids, the sensitivity of each component requires unique ids: "
+                                 f"{duplicates}")
+        years = np.arange(1, time_horizon + 1)
+        discount = (1 + int_rate) ** -years.astype(float)
+        batch = self.compute_cashflow_batch(time_horizon=time_horizon, tax_rate=tax_rate, int_rate=int_rate,
+                                            other_capex_perc=other_capex_perc,
+                                            flows_and_prices=self.flows_batch(), irr=False)
+        cashflow = batch['cashflow'][0]
+
+        sensitivity = {'NPV': batch['NPV'][0]}
+        for key in ['price_sold', 'price_buy', 'decay', 'sold', 'self_cons', 'purchased']:
+            sensitivity[key] = {}
+        sold_revenue = 0
+        for key, values in self.annual_en_flows_and_prices.items():
+            decay = np.float_power(1 - values['decay'], years - 1)
+            sold = self.yearly(values['sold'], time_horizon)
+            self_cons = self.yearly(values['self_cons'], time_horizon)
+            purchased = self.yearly(values['purchased'], time_horizon)
+            sensitivity['price_sold'][key] = np.sum(sold * decay * (1 - tax_rate) * discount)
+            sensitivity['price_buy'][key] = np.sum((self_cons * decay - purchased) * discount)
+            sensitivity['sold'][key] = values['price_sold'] * (1 - tax_rate) * np.sum(decay * discount)
+            sensitivity['self_cons'][key] = values['price_buy'] * np.sum(decay * discount)
+            sensitivity['purchased'][key] = -values['price_buy'] * np.sum(discount)
+            # d/d decay of (1 - decay) ** (year - 1)
+            decay_slope = np.where(years > 1, -(years - 1) * np.float_power(1 - values['decay'],
+                                                                             np.maximum(years - 2, 0)), 0)
+            sensitivity['decay'][key] = np.sum((sold * values['price_sold'] * (1 - tax_rate)
+                                                + self_cons * values['price_buy']) * decay_slope * discount)
+            sold_revenue = sold_revenue + sold * values['price_sold'] * decay
+
+        total_percentage = sum(other_capex_perc)
+        if components:
+            sensitivity['cap_cost'] = {}
+            sensitivity['inc_year'] = {}
+            for component in self.components:
+                start, end = component.inc_start_end
+                sensitivity['cap_cost'][component.id] = -component.cap / (1 - total_percentage)
+                sensitivity['inc_year'][component.id] = np.sum(discount[(start <= years) & (years <= end)])
+        sensitivity['other_capex_perc'] = [-batch['capex'][0] / (1 - total_percentage)] * len(other_capex_perc)
+        sensitivity['capex_factor'] = -batch['capex'][0]
+        sensitivity['incentive_factor'] = np.sum(batch['rev_incentives'][0, 1:] * discount)
+        sensitivity['tax_rate'] = -np.sum(sold_revenue * discount)
+        sensitivity['int_rate'] = -np.sum(years * cashflow[1:] * discount / (1 + int_rate))
+        return sensitivity
+
+    def flows_batch(self):
+        """
+        :return: dict : annual_en_flows_and_prices with the lists of weather years as (1 x weather years) rows (single
+            scenario of compute_cashflow_batch)
+        """
+        flows_and_prices = {}
+        for key, values in self.annual_en_flows_and_prices.items():
+            flows_and_prices[key] = dict(values)
+            for flow in ['sold', 'self_cons', 'purchased']:
+                if np.ndim(values[flow]) == 1:
+                    flows_and_prices[key][flow] = np.reshape(values[flow], (1, -1))
+        return flows_and_prices
+
+    def break_even(self, parameter, time_horizon, tax_rate, int_rate, other_capex_perc=[0]):
+        """
+        break-even value (NPV = 0) of an input, in closed form from the NPV and its derivative (the NPV is linear in
+        the input), with all the other inputs unchanged
+
+        :param parameter: str : 'price_sold' or 'price_buy' (one value per carrier), 'cap_cost' or 'inc_year' (one value
+            per component, the component ids must be unique), 'capex_factor' or 'incentive_factor' (multiplier of the investment cost or of all the
+            incentives)
+        :param time_horizon: int : investment time horizon (year)
+        :param tax_rate: float: tax on revenues from sale e.g 0.2
+        :param int_rate: float: interest rate for calculating NPV e.g 0.03
+        :param other_capex_perc: list of other capex as percentage of total capex e.g [0.2,0.5]
+        :return: dict : {carrier or component id: break-even value} e.g. {'electricity': 0.085}, {'all': 1.2} for the
+            multipliers, nan when the NPV does not depend on the input
+        """
+        sensitivity = self.npv_sensitivity(time_horizon=time_horizon, tax_rate=tax_rate, int_rate=int_rate,
+                                           other_capex_perc=other_capex_perc,
+                                           components=parameter in ['cap_cost', 'inc_year'])
+        if parameter in ['price_sold', 'price_buy']:
+            current = {key: values[parameter] for key, values in self.annual_en_flows_and_prices.items()}
+        elif parameter == 'cap_cost':
+            current = {component.id: component.cap_cost_unit for component in self.components}
+        elif parameter == 'inc_year':
+            current = {component.id: component.inc_year for component in self.components}
+        elif parameter in ['capex_factor', 'incentive_factor']:
+            current = {'all': 1.0}
+            sensitivity[parameter] = {'all': sensitivity[parameter]}
+        else:
+            raise ValueError(f"Unrecognized break-even parameter: {parameter}")
+
+        break_even = {}
+        for key, value in current.items():
+            slope = sensitivity[parameter][key]
+            break_even[key] = value - sensitivity['NPV'] / slope if slope != 0 else np.nan
+        return break_even
+
+    @staticmethod
+    def irr(cashflow, low=-0.99, high=10, tol=1e-12, max_iter=200):
+        """
+        internal rate of return of each row, by bisection on all the rows at once: the rate in [low, high] where the
+        NPV changes sign (with a single sign change of the cash flows, the conventional case, the root is unique)
+
+        :param cashflow: array (N x years) : cash flows from year 0
+        :param low: float : lower bound of the rate
+        :param high: float : upper bound of the rate
+        :param tol: float : tolerance on the rate
+        :param max_iter: int : max. number of bisections
+        :return: array (N) : IRR, nan when the NPV does not change sign in [low, high]
+        """
+        cashflow = np.atleast_2d(np.asarray(cashflow, dtype=float))
+        t = np.arange(cashflow.shape[1])
+
+        def npv(rate):
+            return (cashflow / (1 + rate[:, None]) ** t).sum(axis=1)
 
+        low = np.full(len(cashflow), float(low))
+        high = np.full(len(cashflow), float(high))
+        f_low = npv(low)
+        valid = np.sign(f_low) * np.sign(npv(high)) < 0
+        for _ in range(max_iter):
+            mid = (low + high) / 2
+            f_mid = npv(mid)
+            left = np.sign(f_mid) == np.sign(f_low)
+            low = np.where(left, mid, low)
+            f_low = np.where(left, f_mid, f_low)
+            high = np.where(left, high, mid)
+            if np.all(high - low < tol):
+                break
+        return np.where(valid, (low + high) / 2, np.nan)
@@ -0,0 +1,179 @@
+"""
+Created on October 18 08:00:00 2026
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+class MonteCarlo:
+    # numpy Generator method and parameters of each distribution
+    distribution_types = {'normal': ['loc', 'scale'],
+                          'uniform': ['low', 'high'],
+                          'triangular': ['left', 'mode', 'right'],
+                          'lognormal': ['mean', 'sigma'],
+                          'integers': ['low', 'high'],
+                          'fixed': ['value']}
+    carrier_parameters = ['price_sold', 'price_buy', 'decay']
+    scenario_parameters = ['int_rate', 'tax_rate', 'incentive_duration']
+
+    def __init__(self, economics, time_horizon, tax_rate, int_rate, other_capex_perc, distributions):
+        """
+        economic risk analysis: the uncertain inputs are sampled from their distributions and the cash flows of all
+        the draws are evaluated at once by Economics.compute_cashflow_batch, with the annual energy flows of the
+        economics (no energy simulation is repeated).
+
+        :param economics: obj by Economics --> components and annual_en_flows_and_prices of a prosumer or REC
+        :param time_horizon: int --> investment time horizon (year)
+        :param tax_rate: float --> tax on revenues from sale e.g 0.2, used when not sampled
+        :param int_rate: float --> interest rate for calculating NPV e.g 0.03, used when not sampled
+        :param other_capex_perc: list of other capex as percentage of total capex e.g [0.2,0.5]
+        :param distributions: dict --> distribution of each uncertain input, e.g.
+            {'int_rate': {'dist': 'uniform', 'low': 0.02, 'high': 0.05},
+             'incentive_duration': {'dist': 'integers', 'low': 5, 'high': 11},
+             'price_sold': {'dist': 'normal', 'loc': 1, 'scale': 0.15, 'relative': True},
+             'heat': {'price_buy': {'dist': 'triangular', 'left': 60, 'mode': 80, 'right': 120}}}
+            price_sold, price_buy and decay apply to every carrier (sampled independently for each carrier), unless
+            given under the carrier. 'dist' is one of distribution_types (numpy Generator methods, 'integers' excludes
+            high), with 'relative': True the draws multiply the deterministic value, 'min' and 'max' clip the draws.
+            incentive_duration is the number of years of incentives from the start of inc_start_end.
+        """
+        self.economics = economics
+        self.time_horizon = time_horizon
+        self.tax_rate = tax_rate
+        self.int_rate = int_rate
+        self.other_capex_perc = other_capex_perc
+        self.carriers = list(economics.annual_en_flows_and_prices)
+
+        self.distributions = {}
+        for key, dist in distributions.items():
+            if key in self.scenario_parameters or key in self.carrier_parameters:
+                self.distributions[key] = self.check(key, dist)
+            elif key in self.carriers:
+                for parameter, carrier_dist in dist.items():
+                    if parameter not in self.carrier_parameters:
+                        raise ValueError(f"Unrecognized uncertain input for {key}: {parameter}")
+                    self.distributions[(key, parameter)] = self.check(parameter, carrier_dist)
+            else:
+                raise ValueError(f"Unrecognized uncertain input: {key}")
+        self.samples = {}
+
+    def check(self, parameter, dist):
+        """
+        :return: dict --> the distribution, validated
+        """
+        if dist.get('dist') not in self.distribution_types:
+            raise ValueError(f"Unrecognized distribution for {parameter}: {dist.get('dist')}")
+        missing = [name for name in self.distribution_types[dist['dist']] if name not in dist]
+        if missing:
+            raise ValueError(f"Missing parameters of the {dist['dist']} distribution of {parameter}: {missing}")
+        if parameter == 'incentive_duration' and dist.get('relative', False):
+            raise ValueError("incentive_duration cannot be relative")
+        return dist
+
+    @staticmethod
+    def draw(rng, dist, n, base=1.0):
+        """
+        :param rng: numpy Generator
+        :param dist: dict --> distribution (see __init__)
+        :param n: int --> number of draws
+        :param base: float --> deterministic value, multiplied by the draws of relative distributions
+        :return: array (n)
+        """
+        params = {name: dist[name] for name in MonteCarlo.distribution_types[dist['dist']]}
+        if dist['dist'] == 'fixed':
+            values = np.full(n, float(params['value']))
+        else:
+            values = getattr(rng, dist['dist'])(size=n, **params).astype(float)
+        if dist.get('relative', False):
+            values = values * base
+        if 'min' in dist or 'max' in dist:
+            values = np.clip(values, dist.get('min', -np.inf), dist.get('max', np.inf))
+        return values
+
+    def sample(self, n, rng):
+        """
+        draws the uncertain inputs, in a fixed order (carriers in the order of the flows, then the scenario parameters)
+
+        :param n: int --> number of draws
+        :param rng: numpy Generator
+        :return: flows_and_prices, scenario: dict --> inputs of compute_cashflow_batch with arrays (n) for the sampled
+            values
+        """
+        flows_and_prices = self.economics.flows_batch()
+        for carrier in self.carriers:
+            for parameter in self.carrier_parameters:
+                dist = self.distributions.get((carrier, parameter), self.distributions.get(parameter))
+                if dist is not None:
+                    flows_and_prices[carrier][parameter] = self.draw(rng, dist, n,
+                                                                     flows_and_prices[carrier][parameter])
+
+        scenario = {'tax_rate': self.tax_rate, 'int_rate': self.int_rate, 'incentive_duration': None}
+        for parameter in self.scenario_parameters:
+            if parameter in self.distributions:
+                scenario[parameter] = self.draw(rng, self.distributions[parameter], n,
+                                                scenario[parameter] if scenario[parameter] is not None else 1.0)
+        return flows_and_prices, scenario
+
+    def evaluate(self, n, seed, irr=False):
+        """
+        samples and evaluates one chunk of draws
+
+        :param n: int --> number of draws
+        :param seed: numpy SeedSequence --> seed of the chunk
+        :param irr: bool --> computes the IRR of each draw
+        :return: dict --> arrays (n) of the outputs 'NPV', 'pbp', 'IRR' and of the sampled inputs, e.g. 'int_rate',
+            ('electricity', 'price_sold')
+        """
+        flows_and_prices, scenario = self.sample(n, np.random.default_rng(seed))
+        ec_perf = self.economics.compute_cashflow_batch(time_horizon=self.time_horizon,
+                                                        other_capex_perc=self.other_capex_perc,
+                                                        flows_and_prices=flows_and_prices, irr=irr, **scenario)
+        draws = {key: np.broadcast_to(ec_perf[key], (n,)) for key in ['NPV', 'pbp', 'IRR']}
+        for carrier in self.carriers:
+            for parameter in self.carrier_parameters:
+                if (carrier, parameter) in self.distributions or parameter in self.distributions:
+                    draws[(carrier, parameter)] = flows_and_prices[carrier][parameter]
+        for parameter in self.scenario_parameters:
+            if parameter in self.distributions:
+                draws[parameter] = scenario[parameter]
+        return draws
+
+    def run(self, n_draws, seed=None, chunk_size=20000, processes=None, percentiles=(5, 25, 50, 75, 95), irr=False):
+        """
+        evaluates n_draws draws in chunks of chunk_size. Each chunk has its own random stream spawned from the seed,
+        so the draws only depend on seed and chunk_size, and not on the number of processes. The draws are kept in
+        self.samples: arrays (n_draws) of the outputs 'NPV', 'pbp', 'IRR' and of the sampled inputs, keyed by
+        parameter e.g. 'int_rate' or by (carrier, parameter) e.g. ('electricity', 'price_sold').
+
+        :param n_draws: int --> number of draws e.g. 100000
+        :param seed: int --> seed of the random streams, None for a random seed
+        :param chunk_size: int --> draws evaluated at once (memory grows with chunk_size x time_horizon)
+        :param processes: int --> chunks evaluated by a pool of processes, None to evaluate them in this process
+        :param percentiles: list of float --> percentiles of the results e.g. [5,50,95]
+        :param irr: bool --> computes the IRR of each draw (slower)
+        :return: ec_risk: dict --> 'n_draws', 'NPV_mean', 'NPV_std', 'p_loss' (probability of NPV < 0) and the
+            percentiles 'NPV_p5', ..., 'pbp_p5', ... (and 'IRR_p5', ... with irr=True, draws without IRR excluded)
+        """
+        if n_draws < 1 or chunk_size < 1:
+            raise ValueError("n_draws and chunk_size must be positive")
+        sizes = [chunk_size] * (n_draws // chunk_size) + ([n_draws % chunk_size] if n_draws % chunk_size else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        irrs = [irr] * len(sizes)
+        if processes is None or len(sizes) == 1:
+            chunks = list(map(self.evaluate, sizes, seeds, irrs))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunks = list(executor.map(self.evaluate, sizes, seeds, irrs))
+        self.samples = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+        npv = self.samples['NPV']
+        ec_risk = {'n_draws': n_draws, 'NPV_mean': npv.mean(), 'NPV_std': npv.std(), 'p_loss': np.mean(npv < 0)}
+        quantities = ['NPV', 'pbp', 'IRR'] if irr else ['NPV', 'pbp']
+        for quantity in quantities:
+            values = self.samples[quantity]
+            values = values[~np.isnan(values)]
+            for p, value in zip(percentiles, np.percentile(values, percentiles) if len(values) else
+                                [np.nan] * len(percentiles)):
+                ec_risk[f"{quantity}_p{p:g}"] = value
+        return ec_risk
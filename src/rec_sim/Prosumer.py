@@ -6,12 +6,14 @@ Created on June 7 08:00:00 2025
 
 import numpy as np
 from src.rec_sim.Economics import Economics
+from src.rec_sim.MonteCarlo import MonteCarlo
 from src.rec_sim.Controller import Controller
+from src.rec_sim.DemandMatrix import DemandMatrix
 
 
 
 class Prosumer:
-    def __init__(self, id, carriers, systems, users, bess=[]):
+    def __init__(self, id, carriers, systems, users, bess=[], aggregate_bess=False, recording='full'):
         """
         simulates the demand-production coupling, integrating one or more energy consumers with one or more production systems. Electric batteries are optional.
 
@@ -20,6 +22,10 @@ class Prosumer:
         :param systems: list of obj by System --> list of production power system of prosumer  example: [pv1,wt2]
         :param users: list of obj by Consumer --> list of consumers physically connected to plants example:[consumer1,consumer2]
         :param bess: list of obj by Bess--> list of battery storage  example: [battery1,battery2]
+        :param aggregate_bess: bool--> identical batteries are simulated as a single virtual unit (see Controller)
+        :param recording: str--> recorded series: 'none' no battery series, 'aggregates' also the battery totals
+            (stored, supply, power, soc and the flows without battery), 'key' also soc, power and case of each battery,
+            'full' all the quantities of each battery (see BessFleet.recording_levels)
         """
 
         self.id = id
@@ -27,10 +33,15 @@ class Prosumer:
         self.users = users
         self.systems = systems
         self.bess = bess
+        self.aggregate_bess = aggregate_bess
+        self.recording = recording
+        self.bess_aggregation = {}
 
 
         self.en_perf_evolution = {}
         self.ec_perf = {}
+        self.ec_inputs = {}
+        self.ec_risk = {}
 
 
     def energy_performance(self, time):
@@ -54,35 +65,26 @@ class Prosumer:
         """
 
         for carrier in self.carriers:
-            d_tot = 0
-            for consumer in self.users:
-                if carrier in consumer.dem.keys():
-                    d_tot += consumer.en_perf_evolution[carrier]
-                else:
-                    d_tot += 0
-
-            p_tot = 0
-            for system in self.systems:
-                if carrier in system.carriers:
-                    p_tot += system.en_perf_evolution[carrier]['prod']
-                else:
-                    p_tot += 0
-
-            self_cons = np.zeros(len(d_tot))
-            surplus = np.zeros(len(d_tot))
-            unmet = np.zeros(len(d_tot))
-            for dt in range(len(d_tot)):
-                p = p_tot[dt]
-                d = d_tot[dt]
-                if p >= d:
-                    surplus[dt] = p - d
-                    unmet[dt] = 0
-                    self_cons[dt] = d
-
-                else:
-                    surplus[dt] = 0
-                    unmet[dt] = d - p
-                    self_cons[dt] = p
+            d_tot = DemandMatrix.sum_demand([consumer for consumer in self.users if carrier in consumer.dem.keys()],
+                                            carrier)
+            p_tot = DemandMatrix.sum_series([system.en_perf_evolution[carrier]['prod'] for system in self.systems
+                                             if carrier in system.carriers])
+            if d_tot is None:
+                d_tot = np.zeros(len(p_tot), dtype=p_tot.dtype)
+            if p_tot is None:
+                p_tot = np.zeros(len(d_tot), dtype=d_tot.dtype)
+
+            # self_cons = min(p, d), surplus = max(p - d, 0), unmet = max(d - p, 0), in place (in the dtype of the
+            # inputs, float32 in single precision)
+            dtype = np.result_type(p_tot, d_tot)
+            self_cons = np.empty(len(d_tot), dtype=dtype)
+            surplus = np.empty(len(d_tot), dtype=dtype)
+            unmet = np.empty(len(d_tot), dtype=dtype)
+            np.minimum(p_tot, d_tot, out=self_cons)
+            np.subtract(p_tot, d_tot, out=surplus)
+            np.maximum(surplus, 0, out=surplus)
+            np.subtract(d_tot, p_tot, out=unmet)
+            np.maximum(unmet, 0, out=unmet)
 
             self.en_perf_evolution[carrier] = {}
             self.en_perf_evolution[carrier]['prod'] = p_tot
@@ -96,25 +98,53 @@ class Prosumer:
                     self.en_perf_evolution[carrier] = {}
                     self.en_perf_evolution[carrier]['prod'] = p_tot
                     self.en_perf_evolution[carrier]['dem'] = d_tot
-                    self.en_perf_evolution[carrier]['self_cons_without_bess'] = self_cons
-                    self.en_perf_evolution[carrier]['surplus_without_bess'] = surplus
-                    self.en_perf_evolution[carrier]['unmet_without_bess'] = unmet
+                    if self.recording != 'none':
+                        self.en_perf_evolution[carrier]['self_cons_without_bess'] = self_cons
+                        self.en_perf_evolution[carrier]['surplus_without_bess'] = surplus
+                        self.en_perf_evolution[carrier]['unmet_without_bess'] = unmet
 
                     bess = self.bess
-                    controller = Controller(bess=bess)
+                    controller = Controller(bess=bess, aggregate=self.aggregate_bess, recording=self.recording)
 
                     stored, supply, power, surplus, deficit, soc = controller.energy_performance(
                         production=p_tot, demand=d_tot, time=time)
-                    self.en_perf_evolution[carrier]['stored'] = stored
-                    self.en_perf_evolution[carrier]['supply'] = supply
-                    self.en_perf_evolution[carrier]['power'] = power
-                    self.en_perf_evolution[carrier]['soc'] = soc
+                    self.bess_aggregation = controller.aggregation
+                    if self.recording != 'none':
+                        self.en_perf_evolution[carrier]['stored'] = stored
+                        self.en_perf_evolution[carrier]['supply'] = supply
+                        self.en_perf_evolution[carrier]['power'] = power
+                        self.en_perf_evolution[carrier]['soc'] = soc
                     self.en_perf_evolution[carrier]['self_cons'] = self_cons + stored
                     self.en_perf_evolution[carrier]['surplus'] = surplus
                     self.en_perf_evolution[carrier]['unmet'] = deficit
 
         return self.en_perf_evolution
 
+    def bess_sizing(self, bess_scenarios, time):
+        """
+        electricity flows of the prosumer with each of several battery configurations, simulated in a single pass
+        (see Controller.energy_performance_batch). energy_performance must be run first, neither the batteries
+        of the prosumer nor the ones of the scenarios are modified, so repeated calls give the same results.
+
+        :param bess_scenarios: list of list of obj by Bess--> one list of batteries per scenario, all with the same
+            number of batteries, e.g. [[bess_10kWh], [bess_20kWh], [bess_30kWh]]
+        :param time: float--> 1 if hourly analysis, 0.25 if quarterly analysis
+        :return: dict--> annual energy (kWh) of each scenario, arrays with one value per scenario:
+            self_cons, surplus, unmet, stored, supply
+        """
+        p_tot = np.asarray(self.en_perf_evolution['electricity']['prod'], dtype=float)
+        d_tot = np.asarray(self.en_perf_evolution['electricity']['dem'], dtype=float)
+
+        stored, supply, power, surplus, deficit, soc = Controller.energy_performance_batch(
+            production=p_tot, demand=d_tot, time=time, bess_scenarios=bess_scenarios)
+
+        self_cons = np.minimum(p_tot, d_tot) + stored
+        return {'self_cons': self_cons.sum(axis=1) * time,
+                'surplus': surplus.sum(axis=1) * time,
+                'unmet': deficit.sum(axis=1) * time,
+                'stored': stored.sum(axis=1) * time,
+                'supply': supply.sum(axis=1) * time}
+
     def economic_performance(self, time_horizon, tax_rate, int_rate, other_capex_perc, annual_en_flows_and_price):
         """
 
@@ -129,4 +159,65 @@ class Prosumer:
         calculator = Economics(components=self.systems+self.bess, annual_en_flows_and_prices=annual_en_flows_and_price)
         ec_perf = calculator.compute_cashflow(time_horizon=time_horizon, tax_rate=tax_rate, int_rate=int_rate, other_capex_perc=other_capex_perc)
         self.ec_perf = ec_perf
+        self.ec_inputs = {'time_horizon': time_horizon, 'tax_rate': tax_rate, 'int_rate': int_rate,
+                          'other_capex_perc': other_capex_perc, 'annual_en_flows_and_price': annual_en_flows_and_price}
         return ec_perf
+
+    def economic_risk(self, distributions, n_draws, seed=None, chunk_size=20000, processes=None,
+                      percentiles=(5, 25, 50, 75, 95), irr=False):
+        """
+        Monte Carlo analysis of the economic performance under uncertain prices, decay, interest rate and incentive
+        duration (see MonteCarlo), with the inputs and the annual energy flows of the last economic_performance
+
+        :param distributions: dict--> distribution of each uncertain input e.g. {'int_rate':{'dist':'uniform','low':0.02,'high':0.05}}
+        :param n_draws: int--> number of draws e.g. 100000
+        :param seed: int--> seed of the draws
+        :param chunk_size: int--> draws evaluated at once
+        :param processes: int--> number of processes evaluating the chunks, None for a single process
+        :param percentiles: list of float--> percentiles of the results
+        :param irr: bool--> also the percentiles of the IRR
+        :return: ec_risk: dict : e.g. ec_risk={'n_draws':100000,'NPV_mean':value,'NPV_std':value,'p_loss':0.12,'NPV_p5':value,...,'pbp_p5':value,...}
+        """
+        monte_carlo = MonteCarlo(economics=self.economics(), time_horizon=self.ec_inputs['time_horizon'],
+                                 tax_rate=self.ec_inputs['tax_rate'], int_rate=self.ec_inputs['int_rate'],
+                                 other_capex_perc=self.ec_inputs['other_capex_perc'], distributions=distributions)
+        ec_risk = monte_carlo.run(n_draws=n_draws, seed=seed, chunk_size=chunk_size, processes=processes,
+                                  percentiles=percentiles, irr=irr)
+        self.ec_risk = ec_risk
+        return ec_risk
+
+    def npv_sensitivity(self, components=True):
+        """
+        exact derivatives of the NPV of the last economic_performance with respect to prices, flows, capex items,
+        incentives and rates (see Economics.npv_sensitivity), without re-simulation
+
+        :param components: bool--> computes the derivatives of each component, which require unique component ids
+
+        :return: sensitivity: dict : e.g. sensitivity={'NPV':value,'price_sold':{'electricity':value},'cap_cost':{'pv1':value},'inc_year':{'pv1':value},...}
+        """
+        return self.economics().npv_sensitivity(time_horizon=self.ec_inputs['time_horizon'],
+                                                tax_rate=self.ec_inputs['tax_rate'],
+                                                int_rate=self.ec_inputs['int_rate'],
+                                                other_capex_perc=self.ec_inputs['other_capex_perc'],
+                                                components=components)
+
+    def break_even(self, parameter):
+        """
+        break-even value (NPV = 0) of an input of the last economic_performance, in closed form (see
+        Economics.break_even)
+
+        :param parameter: str--> 'price_sold', 'price_buy', 'cap_cost', 'inc_year', 'capex_factor' or 'incentive_factor'
+        :return: dict--> e.g. {'electricity': 0.085} for price_sold, {'pv1': 1200} for cap_cost
+        """
+        return self.economics().break_even(parameter=parameter, time_horizon=self.ec_inputs['time_horizon'],
+                                           tax_rate=self.ec_inputs['tax_rate'], int_rate=self.ec_inputs['int_rate'],
+                                           other_capex_perc=self.ec_inputs['other_capex_perc'])
+
+    def economics(self):
+        """
+        :return: obj by Economics--> with the components and the annual flows of the last economic_performance
+        """
+        if not self.ec_inputs:
+            raise ValueError(f"economic_performance of {self.id} must be run first")
+        return Economics(components=self.systems+self.bess,
+                         annual_en_flows_and_prices=self.ec_inputs['annual_en_flows_and_price'])
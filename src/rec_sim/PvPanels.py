@@ -9,10 +9,16 @@ Created on June 7 08:00:00 2025
 from math import log
 from math import exp
 from src.rec_sim.System import System
+from scipy.optimize import brentq
+from pathlib import Path
 import numpy as np
+import json
 
 
 class PvPanels(System):
+    # derived single module parameters {datasheet tuple: {'r_serie':..,'gam':..,'il_ref':..,'io_ref':..}}, see module_key
+    module_cache = {}
+
     def __init__(self, id,  cap_cost,  opex_cost, inc_year, inc_start_end, tax_year,carriers=['electricity'],
                  other_cost={'item1': {'unit': 0, 'cost_unit': 0, 'dur': [0, 0]}},
                  other_rev={'item1': {'unit': 0, 'cost_unit': 0, 'dur': [0, 0]}}, mode_mppt=1, isc_ref=10.47, voc_ref=49.3,
@@ -60,6 +66,11 @@ class PvPanels(System):
 
 
 
+        # module datasheet, i.e. everything but the array layout (see unit_module)
+        self.datasheet = {'mode_mppt': mode_mppt, 'isc_ref': isc_ref, 'voc_ref': voc_ref, 't_cell_ref_c': t_cell_ref_c,
+                          'I_tot_ref': I_tot_ref, 'vmppt_ref': vmppt_ref, 'imppt_ref': imppt_ref,
+                          'mu_isc_ref': mu_isc_ref, 'mu_voc_ref': mu_voc_ref, 'ser_cell': ser_cell,
+                          't_cell_noct_c': t_cell_noct_c, 'area': area}
         self.mode_mppt = mode_mppt
         self.isc_ref = isc_ref
         self.voc_ref = voc_ref
@@ -96,14 +107,20 @@ class PvPanels(System):
         self.eff_ref = (self.imppt_ref * self.vmppt_ref) / (self.I_tot_ref * self.area)
         self.ul = (self.I_tot_noct * self.ta_normal) / (self.t_cell_noct_c - self.t_amb_noct)  # [W/(m^2 K)]
 
-        # compute rserie
-        self.r_serie = self.compute_rserie()
-
-        # compute gam, il_ref e io_ref from rserie
-        self.gam = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * self.r_serie) / (
-                self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))  # [dimensionless]
-        self.il_ref = self.isc_ref  # [A]
-        self.io_ref = self.il_ref / exp(self.qbz * self.voc_ref / (self.gam * self.t_cell_ref_c))  # [A]
+        # compute rserie, gam, il_ref e io_ref of a single module, shared by all the arrays using the same datasheet
+        key = self.module_key()
+        if key not in PvPanels.module_cache:
+            r_serie = self.compute_rserie()
+            gam = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * r_serie) / (
+                    self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))  # [dimensionless]
+            il_ref = self.isc_ref  # [A]
+            io_ref = il_ref / exp(self.qbz * self.voc_ref / (gam * self.t_cell_ref_c))  # [A]
+            PvPanels.module_cache[key] = {'r_serie': r_serie, 'gam': gam, 'il_ref': il_ref, 'io_ref': io_ref}
+        self.module_params = PvPanels.module_cache[key]
+        self.r_serie = self.module_params['r_serie']
+        self.gam = self.module_params['gam']
+        self.il_ref = self.module_params['il_ref']
+        self.io_ref = self.module_params['io_ref']
 
         # From single module to array
         self.il_ref = self.n_parallel * self.il_ref  # [A]
@@ -116,69 +133,90 @@ class PvPanels(System):
         self.pmaxappx = self.vmppt_ref * self.imppt_ref * self.n_series * self.n_parallel / 1000  # [W]
         self.vmaxappx = self.vmppt_ref * self.n_series  # [V]
         self.en_perf_evolution = {}  # {'prod':production curve,'surplus': surplus production,'no-coverage': not satisfied demand} level 0 and level 1
+        self.surface = None  # performance surface on an irradiance x ambient temperature grid, see build_surface
 
 
+    def module_key(self):
+        """
+        datasheet values that determine the single module parameters, used as key of PvPanels.module_cache
+        :return: tuple
+        """
+        return (self.isc_ref, self.voc_ref, self.t_cell_ref_c, self.vmppt_ref, self.imppt_ref, self.mu_isc_ref,
+                self.mu_voc_ref, self.ser_cell)
+
+    @classmethod
+    def load_module_cache(cls, path):
+        """
+        loads derived single module parameters saved by save_module_cache into PvPanels.module_cache.
+        Missing files are ignored.
+        :param path: str or Path --> json file
+        """
+        path = Path(path)
+        if not path.exists():
+            return
+        with open(path, "r") as file:
+            for entry in json.load(file):
+                cls.module_cache[tuple(entry['key'])] = entry['params']
+
+    @classmethod
+    def save_module_cache(cls, path):
+        """
+        saves PvPanels.module_cache so that later runs skip the series resistance computation
+        :param path: str or Path --> json file
+        """
+        with open(Path(path), "w") as file:
+            json.dump([{'key': list(key), 'params': params} for key, params in cls.module_cache.items()], file)
+
+    def rserie_residual(self, rs):
+        """
+        residual of the open circuit voltage temperature coefficient for a series resistance rs, zero at the module rserie
+        :param rs: float--> (ohm) series resistance
+        :return: float--> (V/K) residual
+        """
+        gam = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * rs) / (
+                self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))  # [adimensionale]
+        a = gam / self.ser_cell  # [adimensionale]
+        io = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam * self.t_cell_ref_c))  # [A]
+        return -self.mu_voc_ref + (gam / self.qbz) * (
+                log(1 + self.isc_ref / io) + (self.t_cell_ref_c / (self.isc_ref + io)) * (
+                self.mu_isc_ref - self.isc_ref * (
+                (self.qbz * self.eg / (a * self.t_cell_ref_c ** 2)) + 3 / self.t_cell_ref_c)))
+
     def compute_rserie(self):
         """
-        compute rserie by bisection method
+        compute rserie by Brent's method between 0 and the value at which gamma equals the number of cells in series.
+        When the residual does not change sign in this interval, the upper limit is returned, as the former bisection did.
         :return: float--> (ohm) rserie
         """
         # upper limits
         rs_up = ((self.ser_cell * self.t_cell_ref_c * log(
             1 - self.imppt_ref / self.isc_ref) / self.qbz) + self.voc_ref - self.vmppt_ref) / self.imppt_ref
-        gam_up = self.ser_cell
-        a_up = 1
-        io_up = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam_up * self.t_cell_ref_c))
-
         # lower limits
         rs_low = 0
-        gam_low = self.qbz * (self.vmppt_ref - self.voc_ref) / (
-                self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))
-        a_low = gam_low / self.ser_cell
-        io_low = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam_low * self.t_cell_ref_c))
-
-        while abs(rs_up - rs_low) > 0.0005:
-            rs_new = 0.5 * (rs_up + rs_low)  # [ohm]
-            gam_new = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * rs_new) / (
-                    self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))
-            a_new = gam_new / self.ser_cell
-            io_new = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam_new * self.t_cell_ref_c))
-            f_up = -self.mu_voc_ref + (gam_up / self.qbz) * (
-                    log(1 + self.isc_ref / io_up) + (self.t_cell_ref_c / (self.isc_ref + io_up)) * (
-                    self.mu_isc_ref - self.isc_ref * (
-                    (self.qbz * self.eg / (a_up * self.t_cell_ref_c ** 2)) + 3 / self.t_cell_ref_c)))
-            f_low = -self.mu_voc_ref + (gam_low / self.qbz) * (
-                    log(1 + self.isc_ref / io_low) + (self.t_cell_ref_c / (self.isc_ref + io_low)) * (
-                    self.mu_isc_ref - self.isc_ref * (
-                    (self.qbz * self.eg / (a_low * self.t_cell_ref_c ** 2)) + 3 / self.t_cell_ref_c)))
-            f_new = -self.mu_voc_ref + (gam_new / self.qbz) * (
-                    log(1 + self.isc_ref / io_new) + (self.t_cell_ref_c / (self.isc_ref + io_new)) * (
-                    self.mu_isc_ref - self.isc_ref * (
-                    (self.qbz * self.eg / (a_new * self.t_cell_ref_c ** 2)) + 3 / self.t_cell_ref_c)))
-
-            if (f_low * f_new) < 0.0:
-                rs_up = rs_new
-
-            elif (f_low * f_new) > 0.0:
-                rs_low = rs_new
-
-            gam_up = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * rs_up) / (
-                    self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))  # [adimensionale]
-            a_up = gam_up / self.ser_cell  # [adimensionale]
-            io_up = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam_up * self.t_cell_ref_c))  # [A]
-            gam_low = self.qbz * (self.vmppt_ref - self.voc_ref + self.imppt_ref * rs_low) / (
-                    self.t_cell_ref_c * log(1 - self.imppt_ref / self.isc_ref))  # [adimensionale]
-            a_low = gam_low / self.ser_cell  # [adimensionale]
-            io_low = self.isc_ref * exp(-self.qbz * self.voc_ref / (gam_low * self.t_cell_ref_c))  # [A]
-
-        r_serie = rs_new
+
+        f_up = self.rserie_residual(rs_up)
+        f_low = self.rserie_residual(rs_low)
+        if f_up * f_low > 0:
+            return rs_up
+        r_serie = brentq(self.rserie_residual, rs_low, rs_up, xtol=1e-10)
         return r_serie
 
+    @staticmethod
+    def compute_iam(theta):
+        """
+        incidence angle modifier of the cover, clipped at zero
+        :param theta: float or array --> (°) angle of incidence
+        :return: float or array --> incidence angle modifier
+        """
+        iam = 1.0 - 1.098 * 10 ** -4 * (theta) + 6.26 * 10 ** -6 * (theta ** 2) + 6.583 * 10 ** -7 * (
+                theta ** 3) - 1.472 * 10 ** -8 * (theta ** 4)
+        return np.maximum(iam, 0)
+
     def compute_total_radiation(self, slope, I_beam, I_skydiff, I_grounddiff, theta=None):
         """
 
         :param slope: float --> (°) slope of PV array
-        :param theta: float -->  (°) angle of incidence of beam radiation on the array surface
+        :param theta: DataSeries or array -->  (°) angle of incidence of beam radiation on the array surface, if None incidence angle modifiers are not applied
         :param I_beam: DataSeries or array --> (W/m^2) The amount of beam solar radiation incident on the array.
         :param I_skydiff: DataSeries or array --> (W/m^2) The amount of sky diffuse solar incident on the array.
         :param I_grounddiff: DataSeries or array --> (W/m^2) The amount of ground reflected diffuse radiation incident on the surface of the array.
@@ -186,37 +224,22 @@ class PvPanels(System):
             I_total: DataSeries or array --> (W/m^2)
         """
 
+        I_beam = np.asarray(I_beam, dtype=float)
+        I_skydiff = np.asarray(I_skydiff, dtype=float)
+        I_grounddiff = np.asarray(I_grounddiff, dtype=float)
+        I_total = I_beam + I_skydiff + I_grounddiff
+
         if theta is not None:
-            I_total = np.zeros((len(I_beam),))
-            for i in range(len(I_beam)):
-                I_total[i] = I_beam[i] + I_skydiff[i] + I_grounddiff[i]
-                if I_total[i] > 0.1:
-                    theta_diff = 59.56748 - 0.09123155 * slope - 0.00054240 * slope ** 2 + 0.00003216 * slope ** 3 - 0.00000017 * slope ** 4
-                    iam_skydiffuse = 1.0 - 1.098 * 10 ** -4 * (theta_diff) + 6.26 * 10 ** -6 * (
-                            theta_diff ** 2) + 6.583 * 10 ** -7 * (theta_diff ** 3) - 1.472 * 10 ** -8 * (
-                                                 theta_diff ** 4)
-                    if iam_skydiffuse < 0.0:
-                        iam_skydiffuse = 0
-
-                    theta_gnd = 90.03182 - 0.6614549 * slope + 0.00479618 * slope ** 2 - 0.00001543 * slope ** 3 + 0.00000002 * slope ** 4
-                    iam_grounddiffuse = 1.0 - 1.098 * 10 ** -4 * (theta_gnd) + 6.26 * 10 ** -6 * (
-                            theta_gnd ** 2) + 6.583 * 10 ** -7 * (theta_gnd ** 3) - 1.472 * 10 ** -8 * (theta_gnd ** 4)
-                    if iam_grounddiffuse < 0.0:
-                        iam_grounddiffuse = 0
-
-                    iam_beam = 1.0 - 1.098 * 10 ** -4 * (theta[i]) + 6.26 * 10 ** -6 * (
-                                (theta[i]) ** 2) + 6.583 * 10 ** -7 * (
-                                       (theta[i]) ** 3) - 1.472 * 10 ** -8 * ((theta[i]) ** 4)
-                    if iam_beam < 0.0:
-                        iam_beam = 0
-                else:
-                    iam_beam = 1
-                    iam_grounddiffuse = 1
-                    iam_skydiffuse = 1
+            # effective incidence angles of sky and ground diffuse radiation depend only on the slope
+            theta_diff = 59.56748 - 0.09123155 * slope - 0.00054240 * slope ** 2 + 0.00003216 * slope ** 3 - 0.00000017 * slope ** 4
+            theta_gnd = 90.03182 - 0.6614549 * slope + 0.00479618 * slope ** 2 - 0.00001543 * slope ** 3 + 0.00000002 * slope ** 4
+            iam_skydiffuse = self.compute_iam(theta_diff)
+            iam_grounddiffuse = self.compute_iam(theta_gnd)
+            iam_beam = self.compute_iam(np.asarray(theta, dtype=float))
 
-                I_total[i] = iam_beam * I_beam[i] + iam_skydiffuse * I_skydiff[i] + iam_grounddiffuse * I_grounddiff[i]
-        else:
-            I_total = np.array(I_beam) + np.array(I_skydiff) + np.array(I_grounddiff)
+            lit = I_total > 0.1
+            I_total[lit] = (iam_beam[lit] * I_beam[lit] + iam_skydiffuse * I_skydiff[lit]
+                            + iam_grounddiffuse * I_grounddiff[lit])
 
         return I_total
 
@@ -318,6 +341,197 @@ class PvPanels(System):
 
         return vmp, imp, p_max, voc, isc, t_cell
 
+    def compute_output_batch(self, I_total, t_amb):
+        """
+        vectorized counterpart of compute_output_0, compute_fill_factor and compute_efficiency.
+        Newton's method for the maximum power point and the fixed-point iteration on the cell temperature run on whole
+        arrays: each time step leaves the iteration as soon as it meets the convergence criteria of the scalar solver
+        (0.001 A on imp, 0.01 K on t_cell, max 100 temperature passes), so both solvers perform the same iterations.
+        Steps without irradiance (I_total = 0) are skipped and return zero output at ambient temperature; as in the
+        scalar solver, steps below 1 W/m^2 start the iteration at ambient temperature and are solved.
+        Tolerance: on the remaining steps results match compute_output_0 within 1e-12 (relative), the residual difference
+        being round-off between math and numpy transcendental functions.
+
+        :param I_total: DataSeries or array --> (W/m^2) Total incident radiation
+        :param t_amb: DataSeries or array --> (°C) ambient temperature
+        :return: vmp: array --> (V) max. power point voltage
+                 imp: array --> (A) current at max. power
+                 p_max: array -->(W) maximum power point along IV curve
+                 voc: array -->(V) open circuit voltage
+                 isc: array -->(A) short circuit current
+                 t_cell: array -->(K) cell temperature
+                 ff: array --> fill factor
+                 eff: array --> efficiency
+        """
+        I_total = np.asarray(I_total, dtype=float)
+        t_amb_k = np.asarray(t_amb, dtype=float) + 273.15  # Celsius-Kelvin
+
+        vmp = np.zeros((len(I_total),))
+        imp = np.zeros((len(I_total),))
+        p_max = np.zeros((len(I_total),))
+        voc = np.zeros((len(I_total),))
+        isc = np.zeros((len(I_total),))
+        t_cell = t_amb_k.copy()
+        ff = np.zeros((len(I_total),))
+        eff = np.zeros((len(I_total),))
+
+        day = np.flatnonzero(I_total != 0)
+        irr = I_total[day]
+        t_amb_day = t_amb_k[day]
+        t_day = np.where(irr < 1, t_amb_day, t_amb_day + (irr * self.ta_normal - irr * self.eff_ref) / self.ul)
+
+        # steps still iterating on the cell temperature (indexes into the day arrays)
+        active = np.arange(len(day))
+        iter_count = 0
+        while active.size > 0:
+            irr_a = irr[active]
+            t_a = t_day[active]
+            il = (irr_a / self.I_tot_ref) * (self.il_ref + self.mu_isc_ref * self.n_parallel * (t_a - self.t_cell_ref_c))
+            il = np.maximum(il, 0)
+            io = self.io_ref * ((t_a / self.t_cell_ref_c) ** 3) * np.exp(
+                (self.qbz * self.eg / self.a) * ((1 / self.t_cell_ref_c) - (1 / t_a)))
+            lit = il > 0
+            io_pos = io > 0
+            k = self.qbz * self.r_serie / (self.gam * t_a)
+
+            voc_a = np.zeros(len(active))
+            voc_a[lit] = self.gam * t_a[lit] * np.log(il[lit] / io[lit] + 1) / self.qbz
+
+            # Newton's method for calculating the maximum power point, with a per-element convergence mask
+            imxn = irr_a / self.I_tot_ref * self.n_parallel * (self.imppt_ref + self.mu_isc_ref * (t_a - self.t_cell_ref_c))
+            todo = np.flatnonzero(lit & (np.abs(imxn) > 0.001))
+            while todo.size > 0:
+                imxo = imxn[todo]
+                il_t = il[todo]
+                io_t = io[todo]
+                k_t = k[todo]
+                imxo = np.where(imxo > il_t, il_t * 0.99, imxo)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    lg = np.log((il_t - imxo + io_t) / io_t) - imxo * k_t
+                    den = 1 + (il_t - imxo + io_t) * k_t
+                    f1 = np.where(io_pos[todo], imxo + (imxo - il_t - io_t) * lg / den, 0)
+                    f1p = np.where(io_pos[todo], 2 + lg / den ** 2, 1)
+                imxn[todo] = imxo - f1 / f1p
+                todo = todo[np.abs(imxn[todo] - imxo) > 0.001]
+
+            imp_a = np.where(lit, imxn, 0)
+            vmp_a = np.zeros(len(active))
+            ok = lit & io_pos
+            vmp_a[ok] = np.log(1 + (il[ok] - imp_a[ok]) / io[ok]) * (t_a[ok] * self.gam / self.qbz) - imp_a[ok] * self.r_serie
+            p_a = imp_a * vmp_a
+
+            idx = day[active]
+            vmp[idx] = vmp_a
+            imp[idx] = imp_a
+            p_max[idx] = p_a
+            voc[idx] = voc_a
+            isc[idx] = il
+            t_cell[idx] = t_a
+
+            t_new = t_amb_day[active] + (irr_a * self.ta_normal * self.array_area - p_a) / (
+                    self.ul * self.array_area)  # [K]
+            if iter_count >= 100:
+                break
+            moving = np.abs(t_a - t_new) > 0.01
+            active = active[moving]
+            t_day[active] = t_new[moving]
+            iter_count = iter_count + 1
+
+        valid = (voc > 0) & (isc > 0)
+        ff[valid] = vmp[valid] * imp[valid] / (voc[valid] * isc[valid])
+        if self.mode_mppt > 0:
+            lit = I_total > 0
+            eff[lit] = p_max[lit] / (I_total[lit] * self.area * self.n_series * self.n_parallel)
+
+        return vmp, imp, p_max, voc, isc, t_cell, ff, eff
+
+    def build_surface(self, I_max=1400, I_step=5, t_min=-30, t_max=50, t_step=1):
+        """
+        solves the equivalent circuit model once on a dense irradiance x ambient temperature grid, so that the output of
+        any time step can be looked up by bilinear interpolation (see compute_output_surface).
+        The max. interpolation error is estimated by solving the model exactly at the centre of every grid cell, where
+        bilinear interpolation is least accurate.
+
+        :param I_max: float --> (W/m^2) upper bound of the irradiance grid, the grid starts at 0 and 1 W/m^2
+        :param I_step: float --> (W/m^2) irradiance grid spacing
+        :param t_min: float --> (°C) lower bound of the ambient temperature grid
+        :param t_max: float --> (°C) upper bound of the ambient temperature grid
+        :param t_step: float --> (°C) ambient temperature grid spacing
+        :return: surface: dict --> {'I_grid':array,'t_grid':array,'vmp':2D array,'imp':2D array,'p_max':2D array,
+                 'voc':2D array,'isc':2D array,'t_cell':2D array,'max_error':float (W) max. error on p_max,
+                 'max_rel_error':float max. error on p_max relative to the array rated power}
+        """
+        # a node at 0 W/m^2 below the first node at 1 W/m^2, where the initial cell temperature changes
+        I_grid = np.concatenate(([0], np.arange(1, I_max + I_step, I_step, dtype=float)))
+        t_grid = np.arange(t_min, t_max + t_step, t_step, dtype=float)
+        I_mesh, t_mesh = np.meshgrid(I_grid, t_grid, indexing='ij')
+        vmp, imp, p_max, voc, isc, t_cell, ff, eff = self.compute_output_batch(I_total=I_mesh.ravel(), t_amb=t_mesh.ravel())
+        shape = I_mesh.shape
+        self.surface = {'I_grid': I_grid, 't_grid': t_grid, 'vmp': vmp.reshape(shape), 'imp': imp.reshape(shape),
+                        'p_max': p_max.reshape(shape), 'voc': voc.reshape(shape), 'isc': isc.reshape(shape),
+                        't_cell': t_cell.reshape(shape)}
+
+        # error check at the centre of the grid cells
+        I_mid, t_mid = np.meshgrid(0.5 * (I_grid[1:] + I_grid[:-1]), 0.5 * (t_grid[1:] + t_grid[:-1]), indexing='ij')
+        p_exact = self.compute_output_batch(I_total=I_mid.ravel(), t_amb=t_mid.ravel())[2]
+        p_interp = self.compute_output_surface(I_total=I_mid.ravel(), t_amb=t_mid.ravel())[2]
+        max_error = np.max(np.abs(p_exact - p_interp))
+        self.surface['max_error'] = max_error
+        self.surface['max_rel_error'] = max_error / (self.vmppt_ref * self.imppt_ref * self.n_series * self.n_parallel)
+
+        return self.surface
+
+    def compute_output_surface(self, I_total, t_amb):
+        """
+        output of the PV array by bilinear interpolation on the performance surface computed by build_surface
+        (built with default grid if missing). Inputs outside the grid are clipped to its bounds, steps without
+        irradiance (I_total <= 0) return zero output at ambient temperature.
+
+        :param I_total: DataSeries or array --> (W/m^2) Total incident radiation
+        :param t_amb: DataSeries or array --> (°C) ambient temperature
+        :return: vmp, imp, p_max, voc, isc, t_cell, ff, eff: arrays --> same as compute_output_batch
+        """
+        if self.surface is None:
+            self.build_surface()
+        surface = self.surface
+        I_total = np.asarray(I_total, dtype=float)
+        t_amb = np.asarray(t_amb, dtype=float)
+
+        def locate(x, grid):
+            i0 = np.clip(np.searchsorted(grid, x, side='right') - 1, 0, len(grid) - 2)
+            w = np.clip((x - grid[i0]) / (grid[i0 + 1] - grid[i0]), 0, 1)
+            return i0, w
+
+        i0, wi = locate(I_total, surface['I_grid'])
+        j0, wj = locate(t_amb, surface['t_grid'])
+        w00 = (1 - wi) * (1 - wj)
+        w10 = wi * (1 - wj)
+        w01 = (1 - wi) * wj
+        w11 = wi * wj
+        night = I_total <= 0
+
+        out = []
+        for key in ['vmp', 'imp', 'p_max', 'voc', 'isc', 't_cell']:
+            table = surface[key]
+            value = (w00 * table[i0, j0] + w10 * table[i0 + 1, j0] + w01 * table[i0, j0 + 1]
+                     + w11 * table[i0 + 1, j0 + 1])
+            if key == 't_cell':
+                value[night] = t_amb[night] + 273.15  # Celsius-Kelvin
+            else:
+                value[night] = 0
+            out.append(value)
+        vmp, imp, p_max, voc, isc, t_cell = out
+
+        ff = np.zeros((len(I_total),))
+        eff = np.zeros((len(I_total),))
+        valid = (voc > 0) & (isc > 0)
+        ff[valid] = vmp[valid] * imp[valid] / (voc[valid] * isc[valid])
+        if self.mode_mppt > 0:
+            lit = I_total > 0
+            eff[lit] = p_max[lit] / (I_total[lit] * self.area * self.n_series * self.n_parallel)
+
+        return vmp, imp, p_max, voc, isc, t_cell, ff, eff
+
     def compute_fill_factor(self, vmp, imp, voc, isc):
         """
         compute fill factor
@@ -356,7 +570,8 @@ class PvPanels(System):
                 eff[i] = 0
         return eff
 
-    def compute_output(self, slope, I_beam, I_skydiff, I_grounddiff, t_amb,theta=None):
+    def compute_output(self, slope, I_beam, I_skydiff, I_grounddiff, t_amb,theta=None, solver='batch', upsample=1,
+                       upsampling='hold', dtype=float):
         """
 
         :param slope: slope of PV array (°)
@@ -365,6 +580,12 @@ class PvPanels(System):
         :param I_skydiff: components of incident radiation (W/m^2)
         :param I_grounddiff:components of incident radiation (W/m^2)
         :param t_amb:ambient temperature (°C)
+        :param solver: str --> 'batch' (default) solves all time steps with compute_output_batch, 'scalar' uses the step by step solver compute_output_0,
+            'surface' interpolates on the performance surface (see build_surface)
+        :param upsample: int --> simulation time steps per step of the weather data. The model is solved at the resolution
+            of the weather data, only the production curve en_perf_evolution[carrier]['prod'] is expanded (see System.upsample)
+        :param upsampling: str --> 'hold' or 'interpolate', see System.upsample
+        :param dtype: numpy dtype --> dtype of the production curve, e.g. np.float32 (the model is always solved in float64)
         :return:
             I_total:DataSeries or array --> (W/m2)
             vmp:DataSeries or array --> (V)
@@ -379,13 +600,53 @@ class PvPanels(System):
 
         I_total = self.compute_total_radiation(slope=slope, theta=theta, I_beam=I_beam, I_skydiff=I_skydiff,
                                                I_grounddiff=I_grounddiff)
-        vmp, imp, p_max, voc, isc, t_cell = self.compute_output_0(I_total=I_total, t_amb=t_amb)
-        ff = self.compute_fill_factor(vmp=vmp, imp=imp, voc=voc, isc=isc)
-        eff = self.compute_efficiency(p_max=p_max, I_total=I_total)
+        if solver == 'batch':
+            vmp, imp, p_max, voc, isc, t_cell, ff, eff = self.compute_output_batch(I_total=I_total, t_amb=t_amb)
+        elif solver == 'surface':
+            vmp, imp, p_max, voc, isc, t_cell, ff, eff = self.compute_output_surface(I_total=I_total, t_amb=t_amb)
+        elif solver == 'scalar':
+            vmp, imp, p_max, voc, isc, t_cell = self.compute_output_0(I_total=I_total, t_amb=t_amb)
+            ff = self.compute_fill_factor(vmp=vmp, imp=imp, voc=voc, isc=isc)
+            eff = self.compute_efficiency(p_max=p_max, I_total=I_total)
+        else:
+            raise ValueError(f"Unrecognized solver: {solver}")
 
         self.en_perf_evolution[self.carriers[0]] = {}
-        self.en_perf_evolution[self.carriers[0]]['prod'] = p_max / 1000
+        self.en_perf_evolution[self.carriers[0]]['prod'] = self.upsample(
+            p_max / 1000, factor=upsample, method=upsampling).astype(dtype, copy=False)
 
         return I_total, vmp, imp, p_max, voc, isc, t_cell, ff, eff
 
+    def unit_module(self):
+        """
+        a single module (n_series=1, n_parallel=1) with the same datasheet of the array
+        :return: obj by PvPanels
+        """
+        return PvPanels(id=f"{self.id}_module", cap_cost=0, opex_cost=0, inc_year=0, inc_start_end=[0, 0], tax_year=0,
+                        carriers=self.carriers, **self.datasheet)
 
+    def scale_output(self, I_total, vmp, imp, p_max, voc, isc, t_cell, ff, eff, upsample=1, upsampling='hold',
+                     dtype=float):
+        """
+        output of the array from the output of a single module with the same datasheet under the same weather
+        (e.g. unit_module().compute_output): voltages scale with n_series, currents with n_parallel, while cell
+        temperature, fill factor and efficiency do not depend on the layout. The result equals compute_output on the
+        array within the tolerance of Newton's method (0.001 A on the module current).
+
+        :param I_total, vmp, imp, p_max, voc, isc, t_cell, ff, eff: DataSeries or array --> module output, see compute_output
+        :param upsample: int --> simulation time steps per step of the weather data, see compute_output
+        :param upsampling: str --> 'hold' or 'interpolate', see System.upsample
+        :param dtype: numpy dtype --> dtype of the production curve, see compute_output
+        :return: I_total, vmp, imp, p_max, voc, isc, t_cell, ff, eff: array --> array output, see compute_output
+        """
+        vmp = np.asarray(vmp) * self.n_series
+        imp = np.asarray(imp) * self.n_parallel
+        p_max = np.asarray(p_max) * (self.n_series * self.n_parallel)
+        voc = np.asarray(voc) * self.n_series
+        isc = np.asarray(isc) * self.n_parallel
+
+        self.en_perf_evolution[self.carriers[0]] = {}
+        self.en_perf_evolution[self.carriers[0]]['prod'] = self.upsample(
+            p_max / 1000, factor=upsample, method=upsampling).astype(dtype, copy=False)
+
+        return I_total, vmp, imp, p_max, voc, isc, t_cell, ff, eff
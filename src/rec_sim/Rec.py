@@ -6,11 +6,14 @@ Created on June 7 08:00:00 2025
 
 import numpy as np
 from src.rec_sim.Economics import Economics
+from src.rec_sim.MonteCarlo import MonteCarlo
 from src.rec_sim.Controller import Controller
+from src.rec_sim.DemandMatrix import DemandMatrix
 
 
 class Rec:
-    def __init__(self, id, carriers, prosumers, consumers, rec_systems=[],rec_bess=[]):
+    def __init__(self, id, carriers, prosumers, consumers, rec_systems=[],rec_bess=[], aggregate_bess=False,
+                 recording='full'):
         """
         simulates a REC which includes prosumers, consumers and power production system of the REC
 
@@ -20,6 +23,8 @@ class Rec:
         :param consumers: list of obj by Consumer --> list of consumers
         :param rec_systems: list of obj by System --> list of production systems
         :param rec_bess: list of obj by Bess --> list of batteries
+        :param aggregate_bess: bool--> identical batteries are simulated as a single virtual unit (see Controller)
+        :param recording: str--> recorded series, see Prosumer
         """
 
         self.id = id
@@ -28,8 +33,14 @@ class Rec:
         self.consumers = consumers
         self.rec_systems = rec_systems
         self.rec_bess = rec_bess
+        self.aggregate_bess = aggregate_bess
+        self.recording = recording
+        self.bess_aggregation = {}
         self.en_perf_evolution = {}
         self.ec_perf={}
+        self.ec_inputs={}
+        self.ec_risk={}
+        self.membership = self.compute_membership()
 
 
 
@@ -53,6 +64,22 @@ class Rec:
 
         return n_members, n_prosumers, n_consumers
 
+    def compute_membership(self):
+        """
+        sparse membership mapping of the REC: for each carrier, the indices of the members holding it
+
+        :return: membership: dict--> {carrier: {'prosumers': array, 'consumers': array, 'rec_systems': array}} indices
+            in self.prosumers, self.consumers and self.rec_systems
+        """
+        membership = {}
+        for carrier in self.carriers:
+            membership[carrier] = {
+                'prosumers': np.flatnonzero([carrier in prosumer.carriers for prosumer in self.prosumers]),
+                'consumers': np.flatnonzero([carrier in consumer.dem for consumer in self.consumers]),
+                'rec_systems': np.flatnonzero([carrier in plant.carriers for plant in self.rec_systems])
+            }
+        return membership
+
     def energy_performance(self, time):
         """
 
@@ -78,56 +105,42 @@ class Rec:
         """
         for carrier in  self.carriers:
 
-            d_consumers=0
-            d_prosumers=0
-            p_prosumers=0
-            p_rec = 0
-            surplus_prosumers=0
-            selfcons_prosumers=0
-            deficit_prosumers=0
-
-
-
-            for prosumer in self.prosumers:
-                if carrier in prosumer.carriers:
-                    p_prosumers+= prosumer.en_perf_evolution[carrier]['prod']
-                    d_prosumers+= prosumer.en_perf_evolution[carrier]['dem']
-                    surplus_prosumers+= prosumer.en_perf_evolution[carrier]['surplus']
-                    selfcons_prosumers+= prosumer.en_perf_evolution[carrier]['self_cons']
-                    deficit_prosumers+= prosumer.en_perf_evolution[carrier]['unmet']
-
-            for consumer in self.consumers:
-                if carrier in consumer.dem:
-                    d_consumers += consumer.en_perf_evolution[carrier]
-
-            for plant in self.rec_systems:
-                if carrier in plant.carriers:
-                    p_rec= plant.en_perf_evolution[carrier]['prod']
-
+            # totals of the members holding the carrier, each quantity accumulated in place member by member
+            members = self.membership[carrier]
+            prosumers = [self.prosumers[i] for i in members['prosumers']]
+            p_prosumers, d_prosumers, surplus_prosumers, selfcons_prosumers, deficit_prosumers = [
+                DemandMatrix.sum_series([prosumer.en_perf_evolution[carrier][quantity] for prosumer in prosumers])
+                for quantity in ['prod', 'dem', 'surplus', 'self_cons', 'unmet']]
+            d_consumers = DemandMatrix.sum_demand([self.consumers[i] for i in members['consumers']], carrier)
+            p_rec = DemandMatrix.sum_series([self.rec_systems[i].en_perf_evolution[carrier]['prod']
+                                             for i in members['rec_systems']])
+
+            parts = [x for x in (p_prosumers, d_consumers, p_rec) if x is not None]
+            len_ref = len(parts[0])
+            dtype = np.result_type(*parts)
+            if p_prosumers is None:
+                # separate arrays, they are stored as distinct series
+                p_prosumers, d_prosumers, surplus_prosumers, selfcons_prosumers, deficit_prosumers = np.zeros(
+                    (5, len_ref), dtype=dtype)
+            if d_consumers is None:
+                d_consumers = np.zeros(len_ref, dtype=dtype)
+            if p_rec is None:
+                p_rec = np.zeros(len_ref, dtype=dtype)
 
             d_tot = d_prosumers + d_consumers
             d_net = deficit_prosumers+d_consumers
             p_tot = p_prosumers+p_rec
             p_net = surplus_prosumers+p_rec
 
-
-            if np.isscalar(p_rec) and p_rec == 0:
-                p_rec = np.zeros(len(p_tot))
-            shared = np.zeros(len(p_tot))
-            surplus_rec =np.zeros(len(p_tot))
-            deficit_rec = np.zeros(len(p_tot))
-
-            for dt in range(len(p_tot)):
-                p = p_net[dt]
-                d = d_net[dt]
-                if p >= d:
-                    surplus_rec[dt] = p - d
-                    deficit_rec[dt] = 0
-                    shared[dt] = d
-                else:
-                    surplus_rec[dt] = 0
-                    deficit_rec[dt] = d - p
-                    shared[dt] = p
+            # shared = min(p_net, d_net), surplus = max(p_net - d_net, 0), unmet = max(d_net - p_net, 0), in place
+            shared = np.empty(len_ref, dtype=dtype)
+            surplus_rec = np.empty(len_ref, dtype=dtype)
+            deficit_rec = np.empty(len_ref, dtype=dtype)
+            np.minimum(p_net, d_net, out=shared)
+            np.subtract(p_net, d_net, out=surplus_rec)
+            np.maximum(surplus_rec, 0, out=surplus_rec)
+            np.subtract(d_net, p_net, out=deficit_rec)
+            np.maximum(deficit_rec, 0, out=deficit_rec)
 
             self.en_perf_evolution[carrier] = {}
             self.en_perf_evolution[carrier]['prod'] = p_tot
@@ -146,14 +159,16 @@ class Rec:
                 if self.rec_bess:
 
                     bess = self.rec_bess
-                    controller = Controller(bess=bess)
+                    controller = Controller(bess=bess, aggregate=self.aggregate_bess, recording=self.recording)
 
                     stored, supply, power, surplus_rec, deficit_rec, soc = controller.energy_performance(
                         production=p_net, demand=d_net, time=time)
-                    self.en_perf_evolution[carrier]['stored'] = stored
-                    self.en_perf_evolution[carrier]['supply'] = supply
-                    self.en_perf_evolution[carrier]['power'] = power
-                    self.en_perf_evolution[carrier]['soc'] = soc
+                    self.bess_aggregation = controller.aggregation
+                    if self.recording != 'none':
+                        self.en_perf_evolution[carrier]['stored'] = stored
+                        self.en_perf_evolution[carrier]['supply'] = supply
+                        self.en_perf_evolution[carrier]['power'] = power
+                        self.en_perf_evolution[carrier]['soc'] = soc
                     self.en_perf_evolution[carrier]['shared'] = shared + stored
                     self.en_perf_evolution[carrier]['surplus'] = surplus_rec
                     self.en_perf_evolution[carrier]['unmet'] = deficit_rec
@@ -177,4 +192,65 @@ class Rec:
         calculator = Economics(components=self.rec_systems+self.rec_bess, annual_en_flows_and_prices=annual_en_flows_and_price)
         ec_perf = calculator.compute_cashflow(time_horizon=time_horizon, tax_rate=tax_rate, int_rate=int_rate, other_capex_perc=other_capex_perc)
         self.ec_perf = ec_perf
+        self.ec_inputs = {'time_horizon': time_horizon, 'tax_rate': tax_rate, 'int_rate': int_rate,
+                          'other_capex_perc': other_capex_perc, 'annual_en_flows_and_price': annual_en_flows_and_price}
         return ec_perf
+
+    def economic_risk(self, distributions, n_draws, seed=None, chunk_size=20000, processes=None,
+                      percentiles=(5, 25, 50, 75, 95), irr=False):
+        """
+        Monte Carlo analysis of the economic performance under uncertain prices, decay, interest rate and incentive
+        duration (see MonteCarlo), with the inputs and the annual energy flows of the last economic_performance
+
+        :param distributions: dict--> distribution of each uncertain input e.g. {'int_rate':{'dist':'uniform','low':0.02,'high':0.05}}
+        :param n_draws: int--> number of draws e.g. 100000
+        :param seed: int--> seed of the draws
+        :param chunk_size: int--> draws evaluated at once
+        :param processes: int--> number of processes evaluating the chunks, None for a single process
+        :param percentiles: list of float--> percentiles of the results
+        :param irr: bool--> also the percentiles of the IRR
+        :return: ec_risk: dict : e.g. ec_risk={'n_draws':100000,'NPV_mean':value,'NPV_std':value,'p_loss':0.12,'NPV_p5':value,...,'pbp_p5':value,...}
+        """
+        monte_carlo = MonteCarlo(economics=self.economics(), time_horizon=self.ec_inputs['time_horizon'],
+                                 tax_rate=self.ec_inputs['tax_rate'], int_rate=self.ec_inputs['int_rate'],
+                                 other_capex_perc=self.ec_inputs['other_capex_perc'], distributions=distributions)
+        ec_risk = monte_carlo.run(n_draws=n_draws, seed=seed, chunk_size=chunk_size, processes=processes,
+                                  percentiles=percentiles, irr=irr)
+        self.ec_risk = ec_risk
+        return ec_risk
+
+    def npv_sensitivity(self, components=True):
+        """
+        exact derivatives of the NPV of the last economic_performance with respect to prices, flows, capex items,
+        incentives and rates (see Economics.npv_sensitivity), without re-simulation
+
+        :param components: bool--> computes the derivatives of each component, which require unique component ids
+
+        :return: sensitivity: dict : e.g. sensitivity={'NPV':value,'price_sold':{'electricity':value},'cap_cost':{'pv1':value},'inc_year':{'pv1':value},...}
+        """
+        return self.economics().npv_sensitivity(time_horizon=self.ec_inputs['time_horizon'],
+                                                tax_rate=self.ec_inputs['tax_rate'],
+                                                int_rate=self.ec_inputs['int_rate'],
+                                                other_capex_perc=self.ec_inputs['other_capex_perc'],
+                                                components=components)
+
+    def break_even(self, parameter):
+        """
+        break-even value (NPV = 0) of an input of the last economic_performance, in closed form (see
+        Economics.break_even)
+
+        :param parameter: str--> 'price_sold', 'price_buy', 'cap_cost', 'inc_year', 'capex_factor' or 'incentive_factor'
+        :return: dict--> e.g. {'electricity': 0.085} for price_sold, {'pv1': 1200} for cap_cost
+        """
+        return self.economics().break_even(parameter=parameter, time_horizon=self.ec_inputs['time_horizon'],
+                                           tax_rate=self.ec_inputs['tax_rate'], int_rate=self.ec_inputs['int_rate'],
+                                           other_capex_perc=self.ec_inputs['other_capex_perc'])
+
+    def economics(self):
+        """
+        :return: obj by Economics--> with the components and the annual flows of the last economic_performance
+        """
+        if not self.ec_inputs:
+            raise ValueError(f"economic_performance of {self.id} must be run first")
+        return Economics(components=self.rec_systems+self.rec_bess,
+                         annual_en_flows_and_prices=self.ec_inputs['annual_en_flows_and_price'])
@@ -4,6 +4,8 @@ Created on June 7 08:00:00 2025
 @author: isabella pizzuti
 """
 
+import numpy as np
+
 
 class System():
     def __init__(self, id, carriers, cap, cap_cost, opex, opex_cost, inc_year, inc_start_end, tax_year,
@@ -45,4 +47,23 @@ class System():
         self.other_rev = other_rev
         self.en_perf_evolution = {}
 
+    @staticmethod
+    def upsample(series, factor, method='hold'):
+        """
+        expands a series from the resolution of the input data (e.g. hourly weather) to the simulation time step
 
+        :param series: DataSeries or array --> series at native resolution
+        :param factor: int --> number of simulation time steps per native step, e.g. 4 for hourly data and 15 min steps
+        :param method: str --> 'hold' repeats each value over its sub-steps, 'interpolate' interpolates linearly between
+            the centres of consecutive native steps (values are held before the first and after the last centre)
+        :return: array --> series at simulation resolution (the input itself when factor is 1)
+        """
+        series = np.asarray(series)
+        if factor == 1:
+            return series
+        if method == 'hold':
+            return np.repeat(series, factor)
+        if method == 'interpolate':
+            x = (np.arange(len(series) * factor) + 0.5) / factor - 0.5
+            return np.interp(x, np.arange(len(series)), series)
+        raise ValueError(f"Unrecognized upsampling method: {method}")